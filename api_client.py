@@ -1,8 +1,15 @@
+import random
 import requests
+import threading
 import time
-from typing import Dict, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import date
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional, Tuple
+import metrics
 from logger import logger, log_error, log_info, log_warning
-from config import API_CONFIG
+from config import API_CONFIG, SCHEDULER_CONFIG
+from providers import LatencyStats, RatesProvider, create_providers
 
 class CurrencyAPIClient:
     def __init__(self):
@@ -10,75 +17,254 @@ class CurrencyAPIClient:
         self.api_key = API_CONFIG['api_key']
         self.base_currency = API_CONFIG['base_currency']
         self.target_currencies = API_CONFIG['target_currencies']
+        self.max_workers = max(1, API_CONFIG['max_workers'])
+        self.providers = create_providers()
+        self.latency: Dict[str, LatencyStats] = {
+            provider.name: LatencyStats() for provider in self.providers
+        }
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_executor_lock = threading.Lock()
+        # Full provider rate vector of the last successful fetch, per base currency
+        self.conversion_rates: Dict[str, Dict[str, float]] = {}
+        # Provider publication times of the primary base (unix seconds)
+        self.last_update_unix: Optional[int] = None
+        self.next_update_unix: Optional[int] = None
+        # Backoff state after 429/5xx responses and network failures
+        self.consecutive_failures = 0
+        self.retry_after: Optional[float] = None
+        # Remaining API quota, refreshed by get_quota() and counted down locally
+        self.requests_remaining: Optional[int] = None
+        self.plan_quota: Optional[int] = None
+        # Monotonic time of the last successful API call, reused as a health probe
+        self.last_success_at: Optional[float] = None
         self.session = requests.Session()
         self.session.timeout = 10
         
+        # Let concurrent batch and hedged fetches keep one pooled connection each
+        adapter = HTTPAdapter(pool_connections=len(self.providers),
+                              pool_maxsize=self.max_workers * len(self.providers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
         self.session.headers.update({
             'User-Agent': 'CurrencyTracker/1.0',
             'Accept': 'application/json',
         })
     
-    def _make_request(self, url: str) -> Tuple[bool, Optional[Dict], Optional[str]]:
+    def _apply_backoff(self, retry_after: Optional[float]):
+        """Update the adaptive scheduler's backoff from the outcome of a fetch.
+        
+        retry_after is None unless the fetch failed with a retryable error
+        (429, 5xx or a network failure); it then holds the Retry-After
+        seconds, or 0 when the provider sent none. Only primary base fetches
+        count, since extra bases are fetched concurrently and finish in any order.
+        """
+        if retry_after is None:
+            self.consecutive_failures = 0
+            self.retry_after = None
+        else:
+            self.consecutive_failures += 1
+            self.retry_after = retry_after or None
+    
+    @staticmethod
+    def _retry_after_seconds(header: Optional[str]) -> float:
         try:
-            response = self.session.get(url)
+            return float(header) if header else 0.0
+        except ValueError:
+            return 0.0
+    
+    def _api_error(self, error_type: str, error_msg: str,
+                   retry_after: Optional[float] = None) -> Tuple[bool, None, str, Optional[float]]:
+        metrics.inc('currency_api_errors_total', help_text='Failed API requests by error type', type=error_type)
+        return False, None, error_msg, retry_after
+    
+    @metrics.timed('currency_api_request_seconds', 'Latency of API HTTP requests including parsing')
+    def _make_request(self, url: str) -> Tuple[bool, Optional[Dict], Optional[str], Optional[float]]:
+        """GET one API URL.
+        
+        Returns success, payload, error message and the retry delay of a
+        retryable failure (see _apply_backoff). Shared state is left alone so
+        that hedged requests which lose the race cannot affect the backoff.
+        """
+        try:
+            response = self.session.get(url, timeout=self.session.timeout)
+            
+            retry_after = None
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = self._retry_after_seconds(response.headers.get('Retry-After'))
             
             if response.status_code == 200:
-                data = response.json()
+                with metrics.timer('currency_api_json_parse_seconds', 'Time spent decoding API JSON'):
+                    data = response.json()
                 if data.get('result') == 'success':
-                    return True, data, None
+                    self.last_success_at = time.monotonic()
+                    return True, data, None, None
                 else:
                     error_msg = data.get('error-type', 'Unknown API error')
-                    return False, None, f"API Error: {error_msg}"
+                    return self._api_error('api_error', f"API Error: {error_msg}")
             elif response.status_code == 401:
-                return False, None, "Invalid API key"
+                return self._api_error('http_401', "Invalid API key")
             elif response.status_code == 403:
-                return False, None, "API access forbidden"
+                return self._api_error('http_403', "API access forbidden")
             elif response.status_code == 429:
-                return False, None, "Rate limit exceeded"
+                return self._api_error('http_429', "Rate limit exceeded", retry_after)
             elif response.status_code == 500:
-                return False, None, "Internal server error"
+                return self._api_error('http_500', "Internal server error", retry_after)
             else:
-                return False, None, f"HTTP {response.status_code}: {response.reason}"
+                return self._api_error(f'http_{response.status_code}', f"HTTP {response.status_code}: {response.reason}",
+                                       retry_after)
                 
         except requests.exceptions.Timeout:
-            return False, None, "Request timeout"
+            return self._api_error('timeout', "Request timeout", 0.0)
         except requests.exceptions.ConnectionError:
-            return False, None, "Connection error"
+            return self._api_error('connection', "Connection error", 0.0)
         except requests.exceptions.RequestException as e:
-            return False, None, f"Request error: {str(e)}"
+            return self._api_error('request', f"Request error: {str(e)}")
         except ValueError as e:
-            return False, None, f"JSON decode error: {str(e)}"
+            return self._api_error('json_decode', f"JSON decode error: {str(e)}")
         except Exception as e:
-            return False, None, f"Unexpected error: {str(e)}"
+            return self._api_error('unexpected', f"Unexpected error: {str(e)}")
     
-    def get_latest_rates(self) -> Tuple[bool, Optional[Dict[str, float]], Optional[str]]:
-        if not self.api_key:
-            return False, None, "API key is not configured"
+    def _ordered_providers(self) -> List[RatesProvider]:
+        """Configured providers, fastest first once enough latency samples exist.
         
-        url = f"{self.base_url}/{self.api_key}/latest/{self.base_currency}"
+        Providers are scored by their hedge percentile latency plus the
+        failure rate weighted by the request timeout.
+        """
+        providers = [provider for provider in self.providers if provider.is_configured()]
+        min_samples = API_CONFIG['hedge_min_samples']
+        if any(self.latency[provider.name].sample_count < min_samples for provider in providers):
+            return providers
         
-        log_info(logger, f"Requesting currency rates from {self.base_currency}")
+        def score(provider: RatesProvider) -> float:
+            return self._hedge_delay(provider) + self.latency[provider.name].failure_rate() * self.session.timeout
         
-        success, data, error_msg = self._make_request(url)
+        return sorted(providers, key=score)
+    
+    def _hedge_delay(self, provider: RatesProvider) -> float:
+        """Latency percentile of a provider, or the default before it has samples"""
+        delay = self.latency[provider.name].percentile(API_CONFIG['hedge_percentile'])
+        return API_CONFIG['hedge_default_delay_seconds'] if delay is None else delay
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._hedge_executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers * len(self.providers),
+                    thread_name_prefix='rates-hedge'
+                )
+            return self._hedge_executor
+    
+    def _fetch_from(self, provider: RatesProvider,
+                    base_currency: str) -> Tuple[bool, Optional[Dict], Optional[str], str, Optional[float]]:
+        """Fetch and normalize one latest-rates payload, recording its latency.
+        
+        The last element is the retry delay of a retryable failure, see _apply_backoff.
+        """
+        started = time.monotonic()
+        success, data, error_msg, retry_after = self._make_request(provider.latest_url(base_currency))
+        self.latency[provider.name].record(time.monotonic() - started, success)
+        
+        if success:
+            if provider is self.providers[0] and self.requests_remaining is not None:
+                self.requests_remaining = max(self.requests_remaining - 1, 0)
+            data = provider.parse_latest(data)
+        return success, data, error_msg, provider.name, retry_after
+    
+    def _fetch_hedged(self, base_currency: str) -> Tuple[bool, Optional[Dict], Optional[str], Optional[str], Optional[float]]:
+        """Fetch from the primary provider, hedging with the secondary when it is slow.
+        
+        The secondary fires once the primary exceeds its latency percentile
+        (or fails); the first valid response wins and the other request is
+        cancelled if it has not started, or otherwise left to finish in the
+        background so its latency still feeds the stats. Only the returned
+        result should drive the backoff; requests that lost are ignored.
+        """
+        providers = self._ordered_providers()
+        if not providers:
+            return False, None, "API key is not configured", None, None
+        if len(providers) == 1:
+            return self._fetch_from(providers[0], base_currency)
+        
+        executor = self._get_hedge_executor()
+        primary, secondary = providers[0], providers[1]
+        hedge_delay = self._hedge_delay(primary)
+        
+        pending = {executor.submit(self._fetch_from, primary, base_currency)}
+        done, pending = wait(pending, timeout=hedge_delay)
+        if done:
+            result = done.pop().result()
+            if result[0]:
+                return result
+            log_warning(logger, "Provider %s failed: %s, trying %s", primary.name, result[2], secondary.name)
+        else:
+            log_info(logger, "Provider %s slower than %.2fs, hedging with %s", primary.name, hedge_delay, secondary.name)
+        
+        pending.add(executor.submit(self._fetch_from, secondary, base_currency))
+        last_result = (False, None, "All providers failed", None, None)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result[0]:
+                    for other in pending:
+                        other.cancel()
+                    return result
+                last_result = result
+        return last_result
+    
+    def _filter_target_rates(self, rates: Dict, base_currency: str) -> Dict[str, float]:
+        """Configured target currencies of a provider rate vector"""
+        filtered_rates = {}
+        
+        if 'ALL' in self.target_currencies:
+            filtered_rates = {
+                currency: float(rate)
+                for currency, rate in rates.items()
+                if currency != base_currency
+            }
+        
+        for currency in self.target_currencies:
+            if currency == 'ALL':
+                continue
+            if currency in rates:
+                filtered_rates[currency] = float(rates[currency])
+            else:
+                log_warning(logger, "Currency %s not found in API response", currency)
+        
+        return filtered_rates
+    
+    def get_latest_rates(self, base_currency: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, float]], Optional[str]]:
+        base_currency = base_currency or self.base_currency
+        
+        log_info(logger, "Requesting currency rates from %s", base_currency)
+        
+        success, data, error_msg, provider_name, retry_after = self._fetch_hedged(base_currency)
+        if base_currency == self.base_currency:
+            self._apply_backoff(retry_after)
         
         if not success:
             log_error(logger, "Failed to get currency rates", Exception(error_msg))
             return False, None, error_msg
         
+        if provider_name != self.providers[0].name:
+            log_info(logger, "Rates for %s served by %s", base_currency, provider_name)
+        
         try:
-            rates = data.get('conversion_rates', {})
-            filtered_rates = {}
+            if base_currency == self.base_currency:
+                self.last_update_unix = data.get('time_last_update_unix')
+                self.next_update_unix = data.get('time_next_update_unix')
             
-            for currency in self.target_currencies:
-                if currency in rates:
-                    filtered_rates[currency] = float(rates[currency])
-                else:
-                    log_warning(logger, f"Currency {currency} not found in API response")
+            rates = data.get('conversion_rates', {})
+            self.conversion_rates[base_currency] = {
+                currency: float(rate) for currency, rate in rates.items()
+            }
+            filtered_rates = self._filter_target_rates(rates, base_currency)
             
             if not filtered_rates:
                 return False, None, "No target currencies found in API response"
             
-            log_info(logger, f"Received {len(filtered_rates)} currency rates")
+            log_info(logger, "Received %d currency rates", len(filtered_rates))
             return True, filtered_rates, None
             
         except Exception as e:
@@ -86,8 +272,113 @@ class CurrencyAPIClient:
             log_error(logger, error_msg, e)
             return False, None, error_msg
     
+    def get_historical_rates(self, day: date, base_currency: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, float]], Optional[str]]:
+        """Target rates of one past day from the primary provider"""
+        base_currency = base_currency or self.base_currency
+        provider = self.providers[0]
+        
+        try:
+            url = provider.history_url(base_currency, day)
+        except NotImplementedError as e:
+            return False, None, str(e)
+        
+        success, data, error_msg, _ = self._make_request(url)
+        if not success:
+            return False, None, error_msg
+        
+        try:
+            rates = provider.parse_latest(data)['conversion_rates']
+            filtered_rates = self._filter_target_rates(rates, base_currency)
+            if not filtered_rates:
+                return False, None, "No target currencies found in API response"
+            return True, filtered_rates, None
+        except Exception as e:
+            return False, None, f"Error processing API response: {str(e)}"
+    
+    def get_latest_rates_for_bases(self, base_currencies: List[str]) -> Tuple[Dict[str, Dict[str, float]], Dict[str, str]]:
+        """Fetch latest rates for several base currencies concurrently.
+        
+        Returns rates and error messages keyed by base currency.
+        """
+        results = {}
+        errors = {}
+        if not base_currencies:
+            return results, errors
+        
+        workers = min(self.max_workers, len(base_currencies))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rates-fetch') as executor:
+            futures = {
+                executor.submit(self.get_latest_rates, base): base
+                for base in base_currencies
+            }
+            for future in as_completed(futures):
+                base = futures[future]
+                try:
+                    success, rates, error_msg = future.result()
+                except Exception as e:
+                    success, rates, error_msg = False, None, f"Unexpected error: {str(e)}"
+                
+                if success and rates:
+                    results[base] = rates
+                else:
+                    errors[base] = error_msg or "Unknown error"
+        
+        log_info(logger, "Batch fetch finished: %d bases succeeded, %d failed", len(results), len(errors))
+        return results, errors
+    
+    def get_quota(self) -> Tuple[bool, Optional[Dict], Optional[str]]:
+        """Read the remaining request quota; this endpoint does not consume quota"""
+        if not self.api_key:
+            return False, None, "API key is not configured"
+        
+        success, data, error_msg, _ = self._make_request(f"{self.base_url}/{self.api_key}/quota")
+        if not success:
+            log_warning(logger, "Failed to get API quota: %s", error_msg)
+            return False, None, error_msg
+        
+        self.plan_quota = data.get('plan_quota')
+        self.requests_remaining = data.get('requests_remaining')
+        log_info(logger, "API quota: %s of %s requests remaining", self.requests_remaining, self.plan_quota)
+        return True, data, None
+    
+    def next_fetch_delay(self, default_seconds: float) -> float:
+        """Seconds until the next fetch is worthwhile.
+        
+        Backs off exponentially after retryable failures, otherwise waits for
+        the provider's next publication; a random jitter spreads replicas out.
+        """
+        jitter = random.uniform(0, SCHEDULER_CONFIG['jitter_seconds'])
+        
+        if self.consecutive_failures:
+            backoff = min(
+                SCHEDULER_CONFIG['backoff_base_seconds'] * 2 ** (self.consecutive_failures - 1),
+                SCHEDULER_CONFIG['backoff_max_seconds']
+            )
+            return max(backoff, self.retry_after or 0) + jitter
+        
+        if self.requests_remaining == 0:
+            log_warning(logger, "API quota exhausted, waiting before the next fetch")
+            return SCHEDULER_CONFIG['backoff_max_seconds'] + jitter
+        
+        if self.next_update_unix and self.next_update_unix > time.time():
+            delay = self.next_update_unix - time.time()
+        else:
+            delay = default_seconds
+        
+        return max(delay, SCHEDULER_CONFIG['min_interval_seconds']) + jitter
+    
     def health_check(self) -> bool:
-        success, _, error_msg = self.get_latest_rates()
+        """Check API availability without spending a rates fetch.
+        
+        Any successful call within the health check window counts as a pass;
+        otherwise the free quota endpoint is used as the probe.
+        """
+        window = API_CONFIG['health_check_ttl_seconds']
+        if self.last_success_at is not None and time.monotonic() - self.last_success_at < window:
+            log_info(logger, "API health check passed (recent successful request)")
+            return True
+        
+        success, _, error_msg = self.get_quota()
         if success:
             log_info(logger, "API health check passed")
             return True
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Historical backfill from the provider and bulk import of local dumps.
+
+    python backfill.py provider --start 2023-01-01 --end 2023-12-31
+    python backfill.py import rates.csv rates.json
+
+Provider days are fetched with bounded concurrency and recorded in a
+checkpoint file once stored, so an interrupted run resumes where it stopped.
+Dumps are CSV or JSON with timestamp, currency_code and rate per row, quoted
+against the primary base currency; JSON may also hold provider history
+payloads, which are converted to the primary base when quoted against another.
+JSON dumps are a top-level array, one object or JSON Lines, parsed one item at
+a time. Everything is loaded with COPY while the responses indexes are
+dropped, then indexes and rollups are rebuilt.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from logger import logger, log_error, log_info, log_warning
+from config import BACKFILL_CONFIG
+from database import db_manager
+from api_client import api_client
+from cross_rates import CrossRateMatrix
+
+# Bytes read per step while streaming a JSON dump
+JSON_CHUNK_SIZE = 1 << 20
+
+Tick = Tuple[datetime, Dict[str, float]]
+
+class LoadStats:
+    """Rows loaded and the time range they cover"""
+
+    def __init__(self):
+        self.rows = 0
+        self.start: Optional[datetime] = None
+        self.end: Optional[datetime] = None
+
+    def load(self, ticks: List[Tick], request_type: str) -> bool:
+        rows = db_manager.bulk_load_rates(ticks, request_type)
+        if rows is None:
+            return False
+        if rows:
+            timestamps = [timestamp for timestamp, _ in ticks]
+            self.start = min([self.start, *timestamps]) if self.start else min(timestamps)
+            self.end = max([self.end, *timestamps]) if self.end else max(timestamps)
+            self.rows += rows
+        return True
+
+def _parse_timestamp(value: str) -> datetime:
+    """ISO date or timestamp; aware values are converted to local time like LOCALTIMESTAMP"""
+    timestamp = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def load_checkpoint(path: str) -> List[str]:
+    """ISO days already stored from the provider"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if isinstance(checkpoint, dict):
+        # Older checkpoints were keyed by base currency
+        return checkpoint.get(api_client.base_currency, [])
+    return checkpoint
+
+def save_checkpoint(path: str, completed_days: List[str]):
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(completed_days, f)
+    os.replace(temporary, path)
+
+def _is_throttled(error_msg: Optional[str]) -> bool:
+    return error_msg == "Rate limit exceeded" or 'quota-reached' in (error_msg or '')
+
+def backfill_provider(start: date, end: date, workers: int,
+                      batch_days: int, checkpoint_path: str, stats: LoadStats) -> bool:
+    """Fetch and store every day in [start, end] that is not checkpointed yet"""
+    base_currency = api_client.base_currency
+    completed = set(load_checkpoint(checkpoint_path))
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    pending = [day for day in days if day.isoformat() not in completed]
+    log_info(logger, "Backfilling %d of %d days for %s", len(pending), len(days), base_currency)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as executor:
+        for offset in range(0, len(pending), batch_days):
+            batch = pending[offset:offset + batch_days]
+            results = list(executor.map(lambda day: (day, api_client.get_historical_rates(day, base_currency)), batch))
+
+            ticks = []
+            throttled = False
+            for day, (success, rates, error_msg) in results:
+                if success:
+                    ticks.append((datetime(day.year, day.month, day.day), rates))
+                else:
+                    failed += 1
+                    throttled = throttled or _is_throttled(error_msg)
+                    log_warning(logger, "No rates for %s: %s", day, error_msg)
+
+            if not stats.load(ticks, 'backfill'):
+                return False
+            completed.update(timestamp.date().isoformat() for timestamp, _ in ticks)
+            save_checkpoint(checkpoint_path, sorted(completed))
+            log_info(logger, "Stored %d days up to %s", len(ticks), batch[-1])
+
+            if throttled:
+                log_warning(logger, "Provider rate limit or quota reached, stopping; rerun to resume")
+                return False
+
+    if failed:
+        log_warning(logger, "%d days failed and will be retried on the next run", failed)
+    return failed == 0
+
+def _check_base(row: Dict):
+    """responses has no base column, so rows must be quoted against the primary base"""
+    base_currency = (row.get('base_code') or api_client.base_currency).strip().upper()
+    if base_currency != api_client.base_currency:
+        raise ValueError(f"Row quoted against {base_currency}, expected {api_client.base_currency}: {row}")
+
+def _read_csv(path: str) -> Iterator[Tuple[datetime, str, float]]:
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            _check_base(row)
+            yield _parse_timestamp(row['timestamp']), row['currency_code'].strip().upper(), float(row['rate'])
+
+def _iter_json(f) -> Iterator:
+    """Items of a top-level JSON array, a single value or JSON Lines, decoded one at a time"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    in_array = None
+    eof = False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ',')):
+            position += 1
+        if position == len(buffer) and not eof:
+            chunk = f.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if position == len(buffer):
+            return
+        if in_array is None:
+            in_array = buffer[position] == '['
+            position += in_array
+            continue
+        if in_array and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The item continues in the next chunk
+            chunk = f.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item
+        position = end
+
+def _read_json(path: str) -> Iterator[Tuple[datetime, str, float]]:
+    primary = api_client.base_currency
+    with open(path, encoding='utf-8') as f:
+        for item in _iter_json(f):
+            if 'conversion_rates' in item:
+                # Provider history payload: one day of rates against its base
+                timestamp = datetime(int(item['year']), int(item['month']), int(item['day']))
+                base_currency = item.get('base_code', primary).upper()
+                rates = item['conversion_rates']
+                if base_currency != primary:
+                    if primary not in rates:
+                        raise ValueError(f"Cannot convert {base_currency} rates of {timestamp.date()} to {primary}")
+                    rates = CrossRateMatrix(base_currency, rates).rates_for_base(primary)
+                for currency, rate in api_client._filter_target_rates(rates, primary).items():
+                    yield timestamp, currency, rate
+            else:
+                _check_base(item)
+                yield _parse_timestamp(item['timestamp']), item['currency_code'].strip().upper(), float(item['rate'])
+
+def import_dump(path: str, batch_size: int, stats: LoadStats) -> bool:
+    """Load one CSV or JSON dump in batches of about batch_size rates"""
+    reader = _read_json if path.lower().endswith('.json') else _read_csv
+    ticks: Dict[datetime, Dict[str, float]] = {}
+    pending = 0
+    for timestamp, currency, rate in reader(path):
+        ticks.setdefault(timestamp, {})[currency] = rate
+        pending += 1
+        if pending >= batch_size:
+            if not stats.load(sorted(ticks.items()), 'import'):
+                return False
+            ticks, pending = {}, 0
+    if ticks and not stats.load(sorted(ticks.items()), 'import'):
+        return False
+    log_info(logger, "Imported %s", path)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historical rates")
+    parser.add_argument('--keep-indexes', action='store_true', help="do not drop responses indexes during the load")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    provider_parser = subparsers.add_parser('provider', help="fetch historical days from the rates provider")
+    provider_parser.add_argument('--start', type=date.fromisoformat, required=True, help="first day, YYYY-MM-DD")
+    provider_parser.add_argument('--end', type=date.fromisoformat, default=date.today() - timedelta(days=1), help="last day, default yesterday")
+    provider_parser.add_argument('--workers', type=int, default=api_client.max_workers, help="concurrent provider requests")
+    provider_parser.add_argument('--batch-days', type=int, default=BACKFILL_CONFIG['batch_days'], help="days stored per COPY and checkpoint")
+    provider_parser.add_argument('--checkpoint', default=BACKFILL_CONFIG['checkpoint_file'], help="checkpoint file")
+
+    import_parser = subparsers.add_parser('import', help="load CSV or JSON dumps")
+    import_parser.add_argument('files', nargs='+', help="dump files")
+    import_parser.add_argument('--batch-size', type=int, default=BACKFILL_CONFIG['batch_size'], help="rates per COPY")
+    args = parser.parse_args()
+
+    if not db_manager.connect() or not db_manager.create_tables():
+        return 1
+
+    stats = LoadStats()
+    try:
+        with db_manager.deferred_response_indexes(enabled=not args.keep_indexes):
+            if args.command == 'provider':
+                ok = backfill_provider(args.start, args.end, max(1, args.workers),
+                                       args.batch_days, args.checkpoint, stats)
+            else:
+                ok = all(import_dump(path, args.batch_size, stats) for path in args.files)
+
+        if stats.rows:
+            db_manager.rebuild_rollups(stats.start, stats.end)
+        log_info(logger, "Loaded %d rates between %s and %s", stats.rows, stats.start, stats.end)
+        return 0 if ok else 1
+    except Exception as e:
+        log_error(logger, "Backfill failed", e)
+        return 1
+    finally:
+        db_manager.disconnect()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Reproducible benchmarks against a local stub rates API and PostgreSQL.
+
+The stub mimics the exchangerate-api v6 payload with configurable latency and
+error rate. All data goes to a separate benchmark database (BENCH_DB_NAME,
+recreated on every run) on the server configured by the usual DB_* settings;
+the service's own DB_NAME is refused. Setup and row counts go through a
+dedicated connection, so only the timed calls use the storage backend.
+Results are printed, or written with --output, as one JSON document.
+
+    python benchmark.py --ticks 50 --history-sizes 10000,1000000,10000000
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+STUB_API_KEY = 'benchmark'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the currency rates service")
+    parser.add_argument('--ticks', type=int, default=50, help="fetch and store ticks to time")
+    parser.add_argument('--currencies', type=int, default=8, help="currencies in every stub response")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="stub API response latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of stub requests answered with HTTP 500")
+    parser.add_argument('--insert-batches', default='10,100,1000', help="rates per request for the insert benchmark")
+    parser.add_argument('--insert-repeats', type=int, default=20, help="requests stored per insert batch size")
+    parser.add_argument('--history-sizes', default='10000,1000000,10000000', help="responses rows to query against")
+    parser.add_argument('--query-repeats', type=int, default=50, help="timed calls per query and history size")
+    parser.add_argument('--database', default=os.getenv('BENCH_DB_NAME', 'currency_bench'), help="benchmark database, dropped and recreated")
+    parser.add_argument('--seed', type=int, default=42, help="seed for stub rates and errors")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Read DB_NAME as the service sees it, before configure_environment overrides it
+    from dotenv import load_dotenv
+    load_dotenv()
+    if args.database == os.getenv('DB_NAME', 'currency_db'):
+        parser.error(f"refusing to drop {args.database}: it is the service database (DB_NAME)")
+    return args
+
+def currency_codes(count: int) -> List[str]:
+    """USD followed by deterministic synthetic three-letter codes"""
+    codes = ['USD']
+    for letters in itertools.product('ABCDEFGHIJKLMNOPQRSTUVWXYZ', repeat=3):
+        if len(codes) >= count + 1:
+            break
+        code = ''.join(letters)
+        if code != 'USD':
+            codes.append(code)
+    return codes
+
+class StubRatesHandler(BaseHTTPRequestHandler):
+    """exchangerate-api v6 look-alike: /{key}/latest/{base} and /{key}/quota"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    error_rate = 0.0
+    rates: Dict[str, float] = {}
+    random = random.Random()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            jitter = [1 + self.random.uniform(-0.001, 0.001) for _ in self.rates]
+
+        parts = self.path.strip('/').split('/')
+        if failed:
+            self._reply(500, {'result': 'error', 'error-type': 'internal-error'})
+        elif len(parts) == 2 and parts[1] == 'quota':
+            self._reply(200, {'result': 'success', 'plan_quota': 1000000, 'requests_remaining': 1000000})
+        elif len(parts) == 3 and parts[1] == 'latest' and parts[2] in self.rates:
+            base_rate = self.rates[parts[2]]
+            now = int(time.time())
+            self._reply(200, {
+                'result': 'success',
+                'base_code': parts[2],
+                'time_last_update_unix': now,
+                'time_next_update_unix': now + 3600,
+                'conversion_rates': {
+                    code: rate / base_rate * factor
+                    for (code, rate), factor in zip(self.rates.items(), jitter)
+                },
+            })
+        else:
+            self._reply(404, {'result': 'error', 'error-type': 'unsupported-code'})
+
+    def _reply(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(args) -> ThreadingHTTPServer:
+    rng = random.Random(args.seed)
+    StubRatesHandler.latency = args.latency_ms / 1000
+    StubRatesHandler.error_rate = args.error_rate
+    StubRatesHandler.random = random.Random(args.seed)
+    StubRatesHandler.rates = {
+        code: 1.0 if code == 'USD' else round(rng.uniform(0.1, 200), 6)
+        for code in currency_codes(args.currencies)
+    }
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRatesHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-rates-api', daemon=True).start()
+    return server
+
+def configure_environment(args, stub_port: int):
+    """Point the service modules at the stub and the benchmark database before importing them"""
+    targets = ','.join(currency_codes(args.currencies)[1:])
+    os.environ.update({
+        'API_KEY': STUB_API_KEY,
+        'API_BASE_URL': f'http://127.0.0.1:{stub_port}',
+        'API_SECONDARY_PROVIDER': '',
+        'TARGET_CURRENCIES': targets,
+        'BASE_CURRENCIES': 'USD',
+        'DB_NAME': args.database,
+        'LEADER_ELECTION': 'false',
+        'STORAGE_BACKEND': 'postgres',
+        'LOG_LEVEL': os.getenv('BENCH_LOG_LEVEL', 'ERROR'),
+    })
+
+def connect(database: str = None):
+    """Autocommit connection for setup and introspection, apart from the backend's pool"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from config import DB_CONFIG
+
+    connection = psycopg2.connect(**dict(DB_CONFIG, database=database or DB_CONFIG['database']),
+                                  cursor_factory=RealDictCursor)
+    connection.autocommit = True
+    return connection
+
+def recreate_database(name: str):
+    from psycopg2 import sql
+
+    with closing(connect('postgres')) as connection, connection.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+        cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    def percentile(percent):
+        return ordered[min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)] * 1000
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def time_calls(func: Callable, repeats: int, before: Callable = None) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_ticks(args) -> Dict:
+    from currency_service import CurrencyService
+
+    service = CurrencyService()
+    if not service.initialize():
+        raise RuntimeError("Service failed to initialize against the stub API")
+    try:
+        started = time.perf_counter()
+        samples = time_calls(service.fetch_and_store_rates, args.ticks)
+        elapsed = time.perf_counter() - started
+        with closing(connect()) as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT status, COUNT(*) AS count FROM requests GROUP BY status;")
+            statuses = {row['status']: row['count'] for row in cursor.fetchall()}
+    finally:
+        service.cleanup()
+
+    return {
+        'ticks': args.ticks,
+        'ticks_per_second': args.ticks / elapsed,
+        'latency': summarize(samples),
+        'requests_by_status': statuses,
+    }
+
+def bench_inserts(args) -> List[Dict]:
+    from database import db_manager
+
+    results = []
+    rng = random.Random(args.seed)
+    for batch_size in (int(size) for size in args.insert_batches.split(',')):
+        rates = {code: rng.uniform(0.1, 200) for code in currency_codes(batch_size)[1:]}
+        def store():
+            request_id = db_manager.insert_request('benchmark', 'pending')
+            db_manager.complete_request(request_id, 'success', rates=rates)
+        db_manager.reset_delta_state()
+        samples = time_calls(store, args.insert_repeats, before=db_manager.reset_delta_state)
+        results.append({
+            'rates_per_request': len(rates),
+            'request': summarize(samples),
+            'per_row_us': statistics.fmean(samples) / len(rates) * 1e6,
+        })
+    return results
+
+def ensure_partitions(cursor, start: date, end: date):
+    """Create the monthly responses partitions covering [start, end] if the table is partitioned"""
+    from psycopg2 import sql
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'responses';")
+    if cursor.fetchone()['relkind'] != 'p':
+        return
+
+    month = start.replace(day=1)
+    while month <= end:
+        following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        cursor.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF responses FOR VALUES FROM (%s) TO (%s);")
+            .format(sql.Identifier(f"responses_{month.year:04d}_{month.month:02d}")),
+            (month, following)
+        )
+        month = following
+
+def grow_history(target_rows: int, codes: List[str]):
+    """Bulk-insert synthetic one-minute ticks until responses holds target_rows rows"""
+    with closing(connect()) as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS count, MIN(timestamp) AS oldest FROM responses;")
+        row = cursor.fetchone()
+        missing_requests = -(-(target_rows - row['count']) // len(codes))
+        if missing_requests <= 0:
+            return
+
+        oldest = row['oldest'] or datetime.now()
+        cursor.execute(
+            "SELECT %s::TIMESTAMP - make_interval(mins => %s) AS start;",
+            (oldest, missing_requests)
+        )
+        start = cursor.fetchone()['start']
+        ensure_partitions(cursor, start.date(), oldest.date())
+
+        cursor.execute("""
+        WITH ticks AS (
+            INSERT INTO requests (timestamp, request_type, status, rates_changed)
+            SELECT %s::TIMESTAMP - make_interval(mins => n), 'benchmark', 'success', %s
+            FROM generate_series(1, %s) AS n
+            RETURNING id, timestamp
+        )
+        INSERT INTO responses (request_id, currency_code, rate, timestamp)
+        SELECT ticks.id, codes.code, 1 + random(), ticks.timestamp
+        FROM ticks CROSS JOIN unnest(%s::VARCHAR[]) AS codes(code);
+        """, (oldest, len(codes), missing_requests, codes))
+        cursor.execute("ANALYZE requests;")
+        cursor.execute("ANALYZE responses;")
+
+def bench_queries(args) -> List[Dict]:
+    from database import db_manager
+
+    codes = currency_codes(args.currencies)[1:]
+    results = []
+    for size in sorted(int(size) for size in args.history_sizes.split(',')):
+        started = time.perf_counter()
+        grow_history(size, codes)
+        load_seconds = time.perf_counter() - started
+
+        with closing(connect()) as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS count FROM responses;")
+            rows = cursor.fetchone()['count']
+
+        db_manager.get_latest_rates()
+        results.append({
+            'history_rows': rows,
+            'load_seconds': load_seconds,
+            'get_latest_rates_cached': summarize(time_calls(db_manager.get_latest_rates, args.query_repeats)),
+            'get_latest_rates_uncached': summarize(time_calls(
+                db_manager.get_latest_rates, args.query_repeats, before=db_manager.snapshot.invalidate
+            )),
+            'get_request_history': summarize(time_calls(db_manager.get_request_history, args.query_repeats)),
+        })
+    return results
+
+def server_version() -> str:
+    with closing(connect()) as connection, connection.cursor() as cursor:
+        cursor.execute("SHOW server_version;")
+        return cursor.fetchone()['server_version']
+
+def main():
+    args = parse_args()
+    stub_server = start_stub_server(args)
+    configure_environment(args, stub_server.server_address[1])
+    recreate_database(args.database)
+
+    from config import DB_POOL_CONFIG, INGEST_CONFIG, STORAGE_CONFIG
+    from database import db_manager
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'parameters': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'db_pool': DB_POOL_CONFIG['enabled'],
+            'partitioned': STORAGE_CONFIG['partitioned'],
+            'copy_threshold': INGEST_CONFIG['copy_threshold'],
+            'delta_storage': INGEST_CONFIG['delta_storage'],
+        },
+    }
+    try:
+        report['tick'] = bench_ticks(args)
+        if not db_manager.connect() or not db_manager.create_tables():
+            raise RuntimeError("Cannot connect to the benchmark database")
+        report['environment']['postgres'] = server_version()
+        report['insert'] = bench_inserts(args)
+        report['queries'] = bench_queries(args)
+    finally:
+        db_manager.disconnect()
+        stub_server.shutdown()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,23 +13,128 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', ''),
 }
 
+# Connection pool configuration (kept apart from DB_CONFIG, which is passed to psycopg2 as-is)
+DB_POOL_CONFIG = {
+    'enabled': os.getenv('DB_POOL_ENABLED', 'false').lower() == 'true',
+    'min_connections': int(os.getenv('DB_POOL_MIN', 1)),
+    'max_connections': int(os.getenv('DB_POOL_MAX', 10)),
+    # Pooled connections idle longer than this are probed with SELECT 1 before reuse
+    'validate_idle_seconds': int(os.getenv('DB_POOL_VALIDATE_IDLE_SECONDS', 30)),
+}
+
 # API configuration
 API_CONFIG = {
     'base_url': os.getenv('API_BASE_URL', 'https://v6.exchangerate-api.com/v6'),
     'api_key': os.getenv('API_KEY', ''),
     'base_currency': 'USD',
-    'target_currencies': ['EUR', 'GBP', 'JPY', 'RUB', 'CAD', 'AUD'],
+    # Extra base currencies fetched concurrently on every tick
+    'base_currencies': [
+        code.strip().upper()
+        for code in os.getenv('BASE_CURRENCIES', 'USD').split(',')
+        if code.strip()
+    ],
+    'max_workers': int(os.getenv('FETCH_MAX_WORKERS', 4)),
+    # Derive extra bases from the primary fetch instead of one request per base
+    'derive_cross_rates': os.getenv('DERIVE_CROSS_RATES', 'true').lower() == 'true',
+    # A successful API call within this window counts as a passed health check
+    'health_check_ttl_seconds': int(os.getenv('API_HEALTH_CHECK_TTL_SECONDS', 600)),
+    # Secondary provider for hedged requests ('' or 'open-er-api')
+    'secondary_provider': os.getenv('API_SECONDARY_PROVIDER', ''),
+    'secondary_base_url': os.getenv('API_SECONDARY_BASE_URL', 'https://open.er-api.com/v6'),
+    # Fire the secondary once the primary exceeds this latency percentile
+    'hedge_percentile': float(os.getenv('API_HEDGE_PERCENTILE', 95)),
+    'hedge_default_delay_seconds': float(os.getenv('API_HEDGE_DEFAULT_DELAY_SECONDS', 2)),
+    'hedge_min_samples': int(os.getenv('API_HEDGE_MIN_SAMPLES', 5)),
+    # Comma-separated list; ALL keeps every currency the provider returns
+    'target_currencies': [
+        code.strip().upper()
+        for code in os.getenv('TARGET_CURRENCIES', 'EUR,GBP,JPY,RUB,CAD,AUD').split(',')
+        if code.strip()
+    ],
+}
+
+# Storage layout and retention
+STORAGE_CONFIG = {
+    # 'postgres' or 'sqlite' for an embedded single-file database
+    'backend': os.getenv('STORAGE_BACKEND', 'postgres').lower(),
+    'sqlite_path': os.getenv('SQLITE_PATH', 'currency.db'),
+    # Create responses as a table range-partitioned by month (new databases only)
+    'partitioned': os.getenv('DB_PARTITIONED', 'false').lower() == 'true',
+    'partitions_ahead': int(os.getenv('DB_PARTITIONS_AHEAD', 2)),
+    # Raw ticks older than this are rolled up into rates_daily; 0 keeps everything
+    'retention_months': int(os.getenv('DB_RETENTION_MONTHS', 0)),
+}
+
+# Ingestion configuration
+INGEST_CONFIG = {
+    # Batches at least this large are written with COPY instead of execute_values
+    'copy_threshold': int(os.getenv('INGEST_COPY_THRESHOLD', 500)),
+    # Store responses rows only for rates that changed since the last stored value
+    'delta_storage': os.getenv('INGEST_DELTA_STORAGE', 'false').lower() == 'true',
+}
+
+# Cache configuration
+CACHE_CONFIG = {
+    # 0 disables the in-memory latest rates snapshot
+    'latest_rates_ttl_seconds': int(os.getenv('LATEST_RATES_TTL_SECONDS', 300)),
 }
 
 # Scheduler configuration
 SCHEDULER_CONFIG = {
     'interval_minutes': int(os.getenv('REQUEST_INTERVAL_MINUTES', 5)),
+    'resident': os.getenv('SERVICE_RESIDENT', 'true').lower() == 'true',
+    # 'interval' polls every interval_minutes; 'adaptive' follows the provider's next update time
+    'mode': os.getenv('SCHEDULER_MODE', 'interval'),
+    'min_interval_seconds': int(os.getenv('SCHEDULER_MIN_INTERVAL_SECONDS', 60)),
+    'jitter_seconds': int(os.getenv('SCHEDULER_JITTER_SECONDS', 30)),
+    'backoff_base_seconds': int(os.getenv('SCHEDULER_BACKOFF_BASE_SECONDS', 30)),
+    'backoff_max_seconds': int(os.getenv('SCHEDULER_BACKOFF_MAX_SECONDS', 1800)),
+}
+
+# Leader election between replicas (requires SERVICE_RESIDENT=true)
+LEADER_CONFIG = {
+    'enabled': os.getenv('LEADER_ELECTION', 'false').lower() == 'true',
+    'lock_key': int(os.getenv('LEADER_LOCK_KEY', 4242001)),
+}
+
+# Embedded read-only HTTP API
+HTTP_CONFIG = {
+    'enabled': os.getenv('HTTP_ENABLED', 'false').lower() == 'true',
+    'host': os.getenv('HTTP_HOST', '0.0.0.0'),
+    'port': int(os.getenv('HTTP_PORT', 8080)),
+    'history_limit': int(os.getenv('HTTP_HISTORY_LIMIT', 1000)),
+}
+
+# In-memory time series configuration
+TIMESERIES_CONFIG = {
+    'enabled': os.getenv('TIMESERIES_ENABLED', 'false').lower() == 'true',
+    # Points kept per currency; each point costs 32 bytes
+    'capacity': int(os.getenv('TIMESERIES_CAPACITY', 2016)),
+}
+
+# Columnar export configuration
+EXPORT_CONFIG = {
+    'directory': os.getenv('EXPORT_DIR', 'export'),
+    'page_size': int(os.getenv('EXPORT_PAGE_SIZE', 50000)),
+}
+
+# Backfill configuration
+BACKFILL_CONFIG = {
+    'checkpoint_file': os.getenv('BACKFILL_CHECKPOINT_FILE', 'backfill_checkpoint.json'),
+    'batch_days': int(os.getenv('BACKFILL_BATCH_DAYS', 31)),
+    'batch_size': int(os.getenv('BACKFILL_BATCH_SIZE', 100000)),
+}
+
+# Metrics configuration
+METRICS_CONFIG = {
+    'enabled': os.getenv('METRICS_ENABLED', 'false').lower() == 'true',
 }
 
 # Logging configuration
 LOGGING_CONFIG = {
     'log_file': os.getenv('LOG_FILE', 'error.log'),
     'log_level': os.getenv('LOG_LEVEL', 'INFO'),
+    'log_format': os.getenv('LOG_FORMAT', 'text').lower(),
 }
 
 # Currencies to track
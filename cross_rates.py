@@ -0,0 +1,59 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+
+class CrossRateMatrix:
+    """N x N conversion matrix derived from a single base-currency rate vector"""
+
+    def __init__(self, base_currency: str, conversion_rates: Dict[str, float]):
+        rates = {
+            code: float(rate)
+            for code, rate in conversion_rates.items()
+            if rate and float(rate) > 0
+        }
+        rates[base_currency] = 1.0
+
+        self.base_currency = base_currency
+        self.currencies: List[str] = sorted(rates)
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        self.vector = np.array([rates[code] for code in self.currencies], dtype=np.float64)
+        # matrix[i, j] is the amount of currency j for one unit of currency i
+        self.matrix = self.vector[np.newaxis, :] / self.vector[:, np.newaxis]
+
+    def __len__(self) -> int:
+        return len(self.currencies)
+
+    def __contains__(self, currency: str) -> bool:
+        return currency in self.index
+
+    def _position(self, currency: str) -> int:
+        try:
+            return self.index[currency]
+        except KeyError:
+            raise ValueError(f"Unknown currency: {currency}") from None
+
+    def rate(self, from_currency: str, to_currency: str) -> float:
+        """Rate for converting one unit of from_currency into to_currency"""
+        return float(self.matrix[self._position(from_currency), self._position(to_currency)])
+
+    def convert(self, from_currency: str, to_currency: str, amount: float) -> float:
+        """Convert a single amount"""
+        return amount * self.rate(from_currency, to_currency)
+
+    def convert_many(self, from_currency: str, to_currency: str, amounts: Sequence[float]) -> np.ndarray:
+        """Convert an array of amounts between one currency pair"""
+        return np.asarray(amounts, dtype=np.float64) * self.rate(from_currency, to_currency)
+
+    def convert_pairs(self, from_currencies: Sequence[str], to_currencies: Sequence[str],
+                      amounts: Sequence[float]) -> np.ndarray:
+        """Convert amounts element-wise, each with its own currency pair"""
+        rows = np.fromiter((self._position(code) for code in from_currencies), dtype=np.intp)
+        cols = np.fromiter((self._position(code) for code in to_currencies), dtype=np.intp)
+        return np.asarray(amounts, dtype=np.float64) * self.matrix[rows, cols]
+
+    def rates_for_base(self, base_currency: str, targets: Optional[Sequence[str]] = None) -> Dict[str, float]:
+        """Rates against another base, as if the provider had been queried for it"""
+        row = self.matrix[self._position(base_currency)]
+        if targets is None:
+            targets = [code for code in self.currencies if code != base_currency]
+        return {code: float(row[self.index[code]]) for code in targets if code in self.index}
@@ -1,39 +1,166 @@
 #!/usr/bin/env python3
+import logging
 import schedule
 import time
 from datetime import datetime
-from typing import Dict, Optional
-from logger import logger, log_error, log_info
-from config import SCHEDULER_CONFIG
+from typing import Dict, List, Optional
+import metrics
+from logger import logger, log_error, log_info, log_warning
+from config import API_CONFIG, HTTP_CONFIG, LEADER_CONFIG, METRICS_CONFIG, SCHEDULER_CONFIG, TIMESERIES_CONFIG
 from database import db_manager
 from api_client import api_client
+from cross_rates import CrossRateMatrix
+from http_api import rates_publisher, start_http_server
+from timeseries import rate_series
 
 class CurrencyService:
     def __init__(self):
         self.db_connected = False
+        self.schema_ready = False
         self.api_healthy = False
+        self.base_rates: Dict[str, Dict[str, float]] = {}
+        self.base_rates_at: Optional[datetime] = None
+        self.cross_rates: Optional[CrossRateMatrix] = None
     
     def initialize(self) -> bool:
         log_info(logger, "=== INITIALIZING CURRENCY SERVICE ===")
         
-        if not db_manager.connect():
-            log_error(logger, "Failed to connect to database")
-            return False
-        self.db_connected = True
+        if not self.db_connected:
+            if not db_manager.connect():
+                log_error(logger, "Failed to connect to database")
+                return False
+            self.db_connected = True
         
-        if not db_manager.create_tables():
-            log_error(logger, "Failed to create database tables")
-            return False
+        if not self.schema_ready:
+            if not db_manager.create_tables():
+                log_error(logger, "Failed to create database tables")
+                return False
+            self.schema_ready = True
         
-        if not api_client.health_check():
-            log_error(logger, "API is unavailable or misconfigured")
-            return False
-        self.api_healthy = True
+        if TIMESERIES_CONFIG['enabled'] and not rate_series.warmed:
+            added = rate_series.warm(db_manager.get_recent_rates(TIMESERIES_CONFIG['capacity']))
+            log_info(logger, "Warmed in-memory time series with %d points", added)
+        
+        if not self.api_healthy:
+            if not api_client.health_check():
+                log_error(logger, "API is unavailable or misconfigured")
+                return False
+            self.api_healthy = True
         
         log_info(logger, "Service initialized successfully")
         return True
     
-    def fetch_and_store_rates(self):
+    def ensure_ready(self) -> bool:
+        """Initialize on first use and reconnect only after a failure"""
+        if self.db_connected and not (db_manager.is_connected() and db_manager.check_health()):
+            log_warning(logger, "Database connection lost, reconnecting")
+            self.db_connected = False
+        
+        if self.db_connected and self.schema_ready and self.api_healthy:
+            return True
+        
+        return self.initialize()
+    
+    def is_leader(self) -> bool:
+        """Whether this replica should fetch; always true without leader election"""
+        if not LEADER_CONFIG['enabled']:
+            return True
+        
+        was_leader = db_manager.is_leader
+        leader = db_manager.try_acquire_leadership()
+        if leader and not was_leader:
+            log_info(logger, "This replica is now the leader")
+            # Another replica may have written since our in-memory state was built
+            db_manager.reset_delta_state()
+            db_manager.snapshot.invalidate()
+        elif was_leader and not leader:
+            log_warning(logger, "Lost leadership, switching to follower mode")
+        return leader
+    
+    def run_tick(self) -> bool:
+        """Run one scheduler tick reusing the resident connections.
+        
+        Returns False when the service was not ready or the rates were not stored.
+        """
+        if not self.ensure_ready():
+            return False
+        
+        stored = True
+        if self.is_leader():
+            stored = self.fetch_and_store_rates()
+        else:
+            log_info(logger, "Follower: skipping fetch, serving reads only")
+        self.publish_rates()
+        self.show_statistics()
+        return stored
+    
+    def publish_rates(self):
+        """Refresh the snapshot served by the HTTP API and the in-memory time series"""
+        latest_rates = db_manager.get_latest_rates()
+        if latest_rates:
+            rates_publisher.publish(latest_rates, self.cross_rates, self.base_rates, self.base_rates_at)
+            if TIMESERIES_CONFIG['enabled']:
+                rate_series.extend(latest_rates)
+    
+    def run_maintenance(self):
+        """Create upcoming partitions and apply the retention policy"""
+        if self.ensure_ready() and self.is_leader():
+            db_manager.maintain_storage()
+    
+    def _base_currencies(self) -> List[str]:
+        """Primary base currency first, followed by the extra configured bases"""
+        bases = [api_client.base_currency]
+        for base in API_CONFIG['base_currencies']:
+            if base not in bases:
+                bases.append(base)
+        return bases
+    
+    def _update_cross_rates(self):
+        """Rebuild the cross-rate matrix from the last full primary rate vector"""
+        conversion_rates = api_client.conversion_rates.get(api_client.base_currency)
+        if conversion_rates:
+            self.cross_rates = CrossRateMatrix(api_client.base_currency, conversion_rates)
+    
+    def _derived_base_rates(self, bases: List[str]) -> Dict[str, Dict[str, float]]:
+        """Rates for extra bases computed from the cross-rate matrix"""
+        targets = None if 'ALL' in api_client.target_currencies else api_client.target_currencies
+        derived = {}
+        for base in bases:
+            if base in self.cross_rates:
+                derived[base] = self.cross_rates.rates_for_base(base, targets)
+            else:
+                log_warning(logger, "Base %s not found in provider rates", base)
+        return derived
+    
+    def _fetch_rates(self):
+        """Fetch the primary base, and derive or concurrently fetch extra bases"""
+        bases = self._base_currencies()
+        primary, extra_bases = bases[0], bases[1:]
+        
+        if not extra_bases or API_CONFIG['derive_cross_rates']:
+            success, rates, error_msg = api_client.get_latest_rates()
+            if success:
+                self._update_cross_rates()
+                if extra_bases and self.cross_rates is not None:
+                    self.base_rates = self._derived_base_rates(extra_bases)
+                    self.base_rates_at = datetime.now()
+            return success, rates, error_msg
+        
+        results, errors = api_client.get_latest_rates_for_bases(bases)
+        
+        self.base_rates = {base: rates for base, rates in results.items() if base != primary}
+        self.base_rates_at = datetime.now()
+        for base, error_msg in errors.items():
+            if base != primary:
+                log_warning(logger, "Failed to get rates for base %s: %s", base, error_msg)
+        
+        if primary in results:
+            self._update_cross_rates()
+            return True, results[primary], None
+        return False, None, errors.get(primary)
+    
+    def fetch_and_store_rates(self) -> bool:
+        """Fetch the latest rates and store them; returns whether they were stored"""
         log_info(logger, "=== STARTING CURRENCY RATES REQUEST ===")
         
         request_id = db_manager.insert_request(
@@ -43,32 +170,32 @@ class CurrencyService:
         
         if not request_id:
             log_error(logger, "Failed to create request record")
-            return
+            return False
         
-        success, rates, error_msg = api_client.get_latest_rates()
+        stored = False
+        success, rates, error_msg = self._fetch_rates()
         
         if success and rates:
-            success_request_id = db_manager.insert_request(
-                request_type='currency_rates',
-                status='success'
-            )
-            
-            if success_request_id:
-                if db_manager.insert_currency_rates(success_request_id, rates):
-                    log_info(logger, f"Rates saved successfully: {len(rates)}")
-                else:
-                    log_error(logger, "Error saving currency rates")
+            if db_manager.complete_request(request_id, 'success', rates=rates):
+                log_info(logger, "Rates saved successfully: %d", len(rates))
+                stored = True
             else:
-                log_error(logger, "Failed to create success request record")
+                log_error(logger, "Error saving currency rates")
+                db_manager.complete_request(
+                    request_id,
+                    'error',
+                    error_message="Failed to store currency rates"
+                )
         else:
-            error_request_id = db_manager.insert_request(
-                request_type='currency_rates',
-                status='error',
+            db_manager.complete_request(
+                request_id,
+                'error',
                 error_message=error_msg
             )
-            log_error(logger, f"Error getting rates: {error_msg}")
+            log_error(logger, "Error getting rates", Exception(error_msg))
         
         log_info(logger, "=== COMPLETED CURRENCY RATES REQUEST ===")
+        return stored
     
     def show_statistics(self):
         log_info(logger, "=== SERVICE STATISTICS ===")
@@ -77,43 +204,111 @@ class CurrencyService:
             log_error(logger, "Database unavailable")
             return
         
+        # The queries below only feed INFO lines
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
         latest_rates = db_manager.get_latest_rates()
         if latest_rates:
             log_info(logger, "Latest currency rates:")
             for rate in latest_rates:
-                log_info(logger, f"  {rate['currency_code']}: {rate['rate']} ({rate['timestamp']})")
+                log_info(logger, "  %s: %s (%s)", rate['currency_code'], rate['rate'], rate['timestamp'])
         else:
             log_info(logger, "No currency rate data available")
         
+        for base, rates in sorted(self.base_rates.items()):
+            log_info(logger, "Rates from %s: %d currencies", base, len(rates))
+        
         request_history = db_manager.get_request_history()
         if request_history:
             success_count = sum(1 for req in request_history if req['status'] == 'success')
             error_count = sum(1 for req in request_history if req['status'] == 'error')
-            log_info(logger, f"Request statistics: Successful={success_count}, Errors={error_count}")
+            log_info(logger, "Request statistics: Successful=%d, Errors=%d", success_count, error_count)
     
     def cleanup(self):
         log_info(logger, "Shutting down service...")
         if self.db_connected:
             db_manager.disconnect()
+            self.db_connected = False
         log_info(logger, "Service stopped")
 
-def job_wrapper():
+@metrics.timed('currency_tick_seconds', 'Duration of a whole fetch, store and publish tick')
+def job_wrapper(service: Optional[CurrencyService] = None) -> bool:
+    if service is not None:
+        return service.run_tick()
+    
+    stored = False
     service = CurrencyService()
     if service.initialize():
-        service.fetch_and_store_rates()
+        stored = service.fetch_and_store_rates()
+        service.publish_rates()
         service.show_statistics()
-        service.cleanup()
+    service.cleanup()
+    return stored
+
+def maintenance_wrapper(service: Optional[CurrencyService] = None):
+    if service is not None:
+        service.run_maintenance()
+        return
+    
+    service = CurrencyService()
+    if service.initialize():
+        db_manager.maintain_storage()
+    service.cleanup()
+
+def run_adaptive(service: Optional[CurrencyService], default_seconds: float):
+    """Sleep until the provider's next update, backing off after failures"""
+    api_client.get_quota()
+    schedule.every().day.do(api_client.get_quota)
+    
+    while True:
+        stored = job_wrapper(service)
+        
+        if LEADER_CONFIG['enabled'] and not db_manager.is_leader:
+            # Followers re-check the lock every interval to take over quickly
+            delay = default_seconds
+        elif not stored and not api_client.consecutive_failures:
+            # The provider answered but the rates were not stored (or the
+            # service was not ready): waiting for the next publication would
+            # skip the current one, so retry after the regular interval
+            delay = default_seconds
+        else:
+            delay = api_client.next_fetch_delay(default_seconds)
+        log_info(logger, "Next fetch in %.0f seconds", delay)
+        
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            schedule.run_pending()
+            time.sleep(min(1, max(deadline - time.monotonic(), 0)))
 
 def main():
+    service = CurrencyService() if SCHEDULER_CONFIG['resident'] else None
+    http_server = None
+    
     try:
         log_info(logger, "Starting currency rates service")
-        
-        job_wrapper()
+        if service is not None:
+            log_info(logger, "Resident mode: connections are kept across ticks")
+        if LEADER_CONFIG['enabled'] and service is None:
+            log_warning(logger, "Leader election needs SERVICE_RESIDENT=true to hold the lock between ticks")
+        if HTTP_CONFIG['enabled'] and service is None:
+            log_warning(logger, "/rates/history answers 503 between ticks unless SERVICE_RESIDENT=true")
+        if HTTP_CONFIG['enabled'] or METRICS_CONFIG['enabled']:
+            http_server = start_http_server()
         
         interval = SCHEDULER_CONFIG['interval_minutes']
-        schedule.every(interval).minutes.do(job_wrapper)
+        schedule.every().day.do(maintenance_wrapper, service)
+        
+        if SCHEDULER_CONFIG['mode'] == 'adaptive':
+            log_info(logger, "Adaptive scheduling: fetching when the provider publishes new rates")
+            log_info(logger, "Press Ctrl+C to stop")
+            run_adaptive(service, interval * 60)
+            return
+        
+        job_wrapper(service)
+        schedule.every(interval).minutes.do(job_wrapper, service)
         
-        log_info(logger, f"Service scheduled to run every {interval} minutes")
+        log_info(logger, "Service scheduled to run every %s minutes", interval)
         log_info(logger, "Press Ctrl+C to stop")
         
         while True:
@@ -125,6 +320,10 @@ def main():
     except Exception as e:
         log_error(logger, "Critical error in main loop", e)
     finally:
+        if http_server is not None:
+            http_server.shutdown()
+        if service is not None:
+            service.cleanup()
         log_info(logger, "Service terminated")
 
 if __name__ == "__main__":
@@ -1,35 +1,219 @@
+import io
+import re
+import threading
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, List, Optional
-from logger import logger, log_error, log_info
-from config import DB_CONFIG
+from contextlib import contextmanager
+from datetime import date, datetime
+from psycopg2 import pool, sql
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import storage
+from logger import logger, log_error, log_info, log_warning
+from storage import (
+    ROLLUP_TABLES, StorageBackend, add_months, count_db_error, count_rows_written, query_timer, retention_cutoff,
+    timed_query
+)
+from config import CACHE_CONFIG, DB_CONFIG, DB_POOL_CONFIG, INGEST_CONFIG, LEADER_CONFIG, STORAGE_CONFIG
 
-class DatabaseManager:
+ROLLUP_STDDEV = storage.rollup_stddev('GREATEST')
+
+# Secondary indexes of responses, including the single-column ones of older schemas
+RESPONSE_INDEXES = {
+    **storage.RESPONSE_INDEXES,
+    'idx_responses_currency_code': 'responses(currency_code)',
+    'idx_responses_timestamp': 'responses(timestamp)',
+}
+
+PARTITION_NAME_PATTERN = re.compile(r'^responses_(\d{4})_(\d{2})$')
+
+class DatabaseManager(StorageBackend):
+    """PostgreSQL storage through psycopg2"""
+    
     def __init__(self):
+        super().__init__(CACHE_CONFIG['latest_rates_ttl_seconds'])
         self.connection = None
-        self.cursor = None
+        self.pool = None
+        self._lock = threading.RLock()
+        self._pool_slots = None
+        # Monotonic time each pooled connection was returned, keyed by id()
+        self._returned_at: Dict[int, float] = {}
+        # Dedicated session holding the leader advisory lock
+        self._leader_connection = None
     
     def connect(self):
-        """Establish database connection"""
+        """Establish database connection or connection pool"""
         try:
-            self.connection = psycopg2.connect(**DB_CONFIG)
-            self.cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            log_info(logger, "Successful connection to PostgreSQL database")
+            if self.is_connected():
+                self.disconnect()
+            
+            if DB_POOL_CONFIG['enabled']:
+                min_connections = DB_POOL_CONFIG['min_connections']
+                max_connections = DB_POOL_CONFIG['max_connections']
+                self.pool = pool.ThreadedConnectionPool(min_connections, max_connections, **DB_CONFIG)
+                self._pool_slots = threading.BoundedSemaphore(max_connections)
+                log_info(logger, "Connection pool to PostgreSQL ready (%d-%d connections)", min_connections, max_connections)
+            else:
+                self.connection = psycopg2.connect(**DB_CONFIG)
+                log_info(logger, "Successful connection to PostgreSQL database")
             return True
         except Exception as e:
             log_error(logger, "Database connection error", e)
             return False
     
     def disconnect(self):
-        """Close database connection"""
+        """Close database connection or connection pool"""
+        self.release_leadership()
         try:
-            if self.cursor:
-                self.cursor.close()
+            if self.pool and not self.pool.closed:
+                self.pool.closeall()
             if self.connection:
                 self.connection.close()
             log_info(logger, "Database connection closed")
         except Exception as e:
             log_error(logger, "Error closing connection", e)
+        finally:
+            self.connection = None
+            self.pool = None
+            self._pool_slots = None
+            self._returned_at = {}
+    
+    def is_connected(self) -> bool:
+        """Check whether the connection or pool is still open"""
+        if self.pool is not None:
+            return not self.pool.closed
+        return self.connection is not None and self.connection.closed == 0
+    
+    def try_acquire_leadership(self) -> bool:
+        """Take or confirm the leader role through a session-level advisory lock.
+        
+        The lock lives as long as the dedicated session, so it is released by
+        PostgreSQL as soon as the leader process or its connection dies.
+        """
+        try:
+            if self._leader_connection is None or self._leader_connection.closed:
+                self.is_leader = False
+                self._leader_connection = psycopg2.connect(
+                    **DB_CONFIG,
+                    keepalives=1,
+                    keepalives_idle=30,
+                    keepalives_interval=10,
+                    keepalives_count=3
+                )
+                self._leader_connection.autocommit = True
+            
+            with self._leader_connection.cursor() as cursor:
+                if self.is_leader:
+                    cursor.execute("SELECT 1;")
+                else:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s);", (LEADER_CONFIG['lock_key'],))
+                    self.is_leader = cursor.fetchone()[0]
+            return self.is_leader
+            
+        except Exception as e:
+            log_error(logger, "Leader election failed", e)
+            self.release_leadership()
+            return False
+    
+    def release_leadership(self):
+        """Give up the leader role by closing the lock session"""
+        try:
+            if self._leader_connection is not None and not self._leader_connection.closed:
+                self._leader_connection.close()
+        except Exception as e:
+            log_error(logger, "Error closing leader connection", e)
+        finally:
+            self._leader_connection = None
+            self.is_leader = False
+    
+    def check_health(self) -> bool:
+        """Run a trivial query to verify the database answers"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("SELECT 1;")
+            return True
+        except Exception as e:
+            log_error(logger, "Database health check failed", e)
+            return False
+    
+    def _is_usable(self, connection) -> bool:
+        """Whether a pooled connection still answers.
+        
+        closed stays 0 when the server dropped the session, so connections
+        not used within validate_idle_seconds are probed with SELECT 1.
+        """
+        if connection.closed != 0:
+            return False
+        returned_at = self._returned_at.get(id(connection))
+        if returned_at is not None and time.monotonic() - returned_at < DB_POOL_CONFIG['validate_idle_seconds']:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+    
+    def _get_pooled_connection(self):
+        """Take a connection from the pool, discarding ones that are closed or dead"""
+        for _ in range(DB_POOL_CONFIG['max_connections'] + 1):
+            connection = self.pool.getconn()
+            if self._is_usable(connection):
+                return connection
+            log_warning(logger, "Discarding broken pooled connection")
+            self._returned_at.pop(id(connection), None)
+            self.pool.putconn(connection, close=True)
+        raise pool.PoolError("No usable connection in pool")
+    
+    @contextmanager
+    def _checkout(self):
+        """Borrow a pooled connection, or lock the shared one in single-connection mode"""
+        if self.pool is None:
+            with self._lock:
+                if not self.is_connected():
+                    raise psycopg2.InterfaceError("Database is not connected")
+                yield self.connection
+            return
+        
+        slots = self._pool_slots
+        slots.acquire()
+        try:
+            connection = self._get_pooled_connection()
+            try:
+                yield connection
+            finally:
+                if connection.closed == 0:
+                    self._returned_at[id(connection)] = time.monotonic()
+                else:
+                    self._returned_at.pop(id(connection), None)
+                self.pool.putconn(connection, close=connection.closed != 0)
+        finally:
+            slots.release()
+    
+    @contextmanager
+    def _transaction(self, cursor_name: Optional[str] = None):
+        """Check out a cursor for one unit of work, committing on success.
+        
+        A cursor_name opens a server-side cursor that streams its result set.
+        """
+        with self._checkout() as connection:
+            try:
+                with connection.cursor(name=cursor_name, cursor_factory=RealDictCursor) as cursor:
+                    yield cursor
+                connection.commit()
+            except Exception as e:
+                count_db_error(e)
+                self._rollback(connection)
+                raise
+    
+    def _rollback(self, connection):
+        """Roll back the current transaction if the connection is still usable"""
+        try:
+            if connection is not None and connection.closed == 0:
+                connection.rollback()
+        except Exception as e:
+            log_error(logger, "Error rolling back transaction", e)
     
     def create_tables(self):
         """Create database tables"""
@@ -40,137 +224,765 @@ class DatabaseManager:
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 request_type VARCHAR(50) NOT NULL,
                 status VARCHAR(20) NOT NULL,
-                error_message TEXT
+                error_message TEXT,
+                rates_changed INTEGER
             );
             """
             
-            create_responses_table = """
-            CREATE TABLE IF NOT EXISTS responses (
-                id SERIAL PRIMARY KEY,
-                request_id INTEGER REFERENCES requests(id) ON DELETE CASCADE,
-                currency_code VARCHAR(3) NOT NULL,
+            # rates_changed is NULL for full writes and counts stored rows in delta mode
+            migrate_requests_table = """
+            ALTER TABLE requests ADD COLUMN IF NOT EXISTS rates_changed INTEGER;
+            """
+            
+            if STORAGE_CONFIG['partitioned']:
+                create_responses_table = """
+                CREATE TABLE IF NOT EXISTS responses (
+                    id SERIAL,
+                    request_id INTEGER REFERENCES requests(id) ON DELETE CASCADE,
+                    currency_code VARCHAR(3) NOT NULL,
+                    rate NUMERIC(16, 8) NOT NULL,
+                    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp);
+                """
+            else:
+                create_responses_table = """
+                CREATE TABLE IF NOT EXISTS responses (
+                    id SERIAL PRIMARY KEY,
+                    request_id INTEGER REFERENCES requests(id) ON DELETE CASCADE,
+                    currency_code VARCHAR(3) NOT NULL,
+                    rate NUMERIC(16, 8) NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+            
+            create_latest_rates_table = """
+            CREATE TABLE IF NOT EXISTS latest_rates (
+                currency_code VARCHAR(3) PRIMARY KEY,
                 rate NUMERIC(16, 8) NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                timestamp TIMESTAMP NOT NULL,
+                request_id INTEGER REFERENCES requests(id) ON DELETE SET NULL,
+                previous_rate NUMERIC(16, 8),
+                previous_timestamp TIMESTAMP
             );
             """
             
-            create_indexes = [
-                "CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests(timestamp);",
-                "CREATE INDEX IF NOT EXISTS idx_responses_request_id ON responses(request_id);",
-                "CREATE INDEX IF NOT EXISTS idx_responses_currency_code ON responses(currency_code);",
-                "CREATE INDEX IF NOT EXISTS idx_responses_timestamp ON responses(timestamp);"
-            ]
+            create_rollup_table = """
+            CREATE TABLE IF NOT EXISTS {table} (
+                currency_code VARCHAR(3) NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                open_rate NUMERIC(16, 8) NOT NULL,
+                high_rate NUMERIC(16, 8) NOT NULL,
+                low_rate NUMERIC(16, 8) NOT NULL,
+                close_rate NUMERIC(16, 8) NOT NULL,
+                open_time TIMESTAMP NOT NULL,
+                close_time TIMESTAMP NOT NULL,
+                sample_count INTEGER NOT NULL,
+                rate_sum DOUBLE PRECISION NOT NULL,
+                rate_sum_sq DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (currency_code, bucket)
+            );
+            """
             
-            self.cursor.execute(create_requests_table)
-            self.cursor.execute(create_responses_table)
+            create_indexes = ["CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests(timestamp);"] + [
+                f"CREATE INDEX IF NOT EXISTS {name} ON {columns};"
+                for name, columns in RESPONSE_INDEXES.items()
+            ]
             
-            for index_query in create_indexes:
-                self.cursor.execute(index_query)
+            with self._transaction() as cursor:
+                cursor.execute(create_requests_table)
+                cursor.execute(migrate_requests_table)
+                cursor.execute(create_responses_table)
+                
+                cursor.execute(create_latest_rates_table)
+                for table in ROLLUP_TABLES.values():
+                    cursor.execute(create_rollup_table.format(table=table))
+                
+                for index_query in create_indexes:
+                    cursor.execute(index_query)
+                
+                self.partitioned = self._is_partitioned(cursor)
+                if self.partitioned:
+                    self._ensure_partitions(cursor)
+                elif STORAGE_CONFIG['partitioned']:
+                    log_warning(logger, "Existing responses table is not partitioned; partitioning applies to new databases")
+                
+                self._seed_latest_rates(cursor)
+                self._seed_rollups(cursor)
             
-            self.connection.commit()
             log_info(logger, "Tables created successfully in database")
             return True
             
         except Exception as e:
             log_error(logger, "Error creating tables", e)
-            if self.connection:
-                self.connection.rollback()
             return False
     
+    def _is_partitioned(self, cursor) -> bool:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('responses');")
+        row = cursor.fetchone()
+        return row is not None and row['relkind'] == 'p'
+    
+    def _list_partitions(self, cursor) -> Dict[date, str]:
+        """Monthly responses partitions keyed by the first day of their month"""
+        cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass('responses');
+        """)
+        partitions = {}
+        for row in cursor.fetchall():
+            match = PARTITION_NAME_PATTERN.match(row['relname'])
+            if match:
+                partitions[date(int(match.group(1)), int(match.group(2)), 1)] = row['relname']
+        return partitions
+    
+    def _ensure_partitions(self, cursor, start: Optional[date] = None, end: Optional[date] = None):
+        """Create monthly partitions from start up to end (default: a few months ahead)"""
+        current_month = date.today().replace(day=1)
+        month = (start or current_month).replace(day=1)
+        end = end or add_months(current_month, STORAGE_CONFIG['partitions_ahead'])
+        
+        existing = self._list_partitions(cursor)
+        while month <= end:
+            if month not in existing:
+                name = f"responses_{month.year:04d}_{month.month:02d}"
+                cursor.execute(
+                    sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF responses FOR VALUES FROM (%s) TO (%s);")
+                    .format(sql.Identifier(name)),
+                    (month, add_months(month, 1))
+                )
+                log_info(logger, "Created partition %s", name)
+            month = add_months(month, 1)
+    
+    def _rollup_from_raw(self, cursor, unit: str, replace: bool,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None,
+                         source: str = 'responses') -> int:
+        """Aggregate raw ticks of `source` (responses or one of its partitions) for `unit`"""
+        if replace:
+            conflict_action = sql.SQL("""DO UPDATE SET
+            open_rate = EXCLUDED.open_rate,
+            high_rate = EXCLUDED.high_rate,
+            low_rate = EXCLUDED.low_rate,
+            close_rate = EXCLUDED.close_rate,
+            open_time = EXCLUDED.open_time,
+            close_time = EXCLUDED.close_time,
+            sample_count = EXCLUDED.sample_count,
+            rate_sum = EXCLUDED.rate_sum,
+            rate_sum_sq = EXCLUDED.rate_sum_sq""")
+        else:
+            conflict_action = sql.SQL("DO NOTHING")
+        
+        query = sql.SQL("""
+        INSERT INTO {table} (
+            currency_code, bucket, open_rate, high_rate, low_rate, close_rate,
+            open_time, close_time, sample_count, rate_sum, rate_sum_sq
+        )
+        SELECT
+            res.currency_code,
+            date_trunc({unit}, res.timestamp) AS bucket,
+            (ARRAY_AGG(res.rate ORDER BY res.timestamp))[1],
+            MAX(res.rate),
+            MIN(res.rate),
+            (ARRAY_AGG(res.rate ORDER BY res.timestamp DESC))[1],
+            MIN(res.timestamp),
+            MAX(res.timestamp),
+            COUNT(*),
+            SUM(res.rate::DOUBLE PRECISION),
+            SUM(res.rate::DOUBLE PRECISION * res.rate::DOUBLE PRECISION)
+        FROM {source} res
+        JOIN requests r ON res.request_id = r.id
+        WHERE r.status = 'success'
+          AND (%(start)s::TIMESTAMP IS NULL OR res.timestamp >= date_trunc({unit}, %(start)s::TIMESTAMP))
+          AND (%(end)s::TIMESTAMP IS NULL OR res.timestamp < date_trunc({unit}, %(end)s::TIMESTAMP) + {step})
+        GROUP BY res.currency_code, date_trunc({unit}, res.timestamp)
+        ON CONFLICT (currency_code, bucket) {conflict_action};
+        """).format(
+            table=sql.Identifier(ROLLUP_TABLES[unit]),
+            unit=sql.Literal(unit),
+            step=sql.Literal(f'1 {unit}') + sql.SQL('::INTERVAL'),
+            source=sql.Identifier(source),
+            conflict_action=conflict_action
+        )
+        cursor.execute(query, {'start': start, 'end': end})
+        return cursor.rowcount
+    
+    def _seed_rollups(self, cursor):
+        """Build rollups once from existing history when the tables are new"""
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {ROLLUP_TABLES['hour']}) AS seeded;")
+        if cursor.fetchone()['seeded']:
+            return
+        for unit in ROLLUP_TABLES:
+            self._rollup_from_raw(cursor, unit, True)
+    
+    def _carry_forward_rates(self, cursor, cutoff: datetime) -> int:
+        """Re-store at the retention cutoff every rate whose last row is older.
+        
+        Under delta storage an unchanged rate may have no row after the
+        cutoff, and pruning its only row would drop the currency from
+        get_rates_as_of().
+        """
+        cursor.execute("""
+        SELECT l.currency_code, l.rate
+        FROM latest_rates l
+        WHERE l.timestamp < %(cutoff)s
+          AND NOT EXISTS (
+              SELECT 1 FROM responses res
+              WHERE res.currency_code = l.currency_code AND res.timestamp >= %(cutoff)s
+          );
+        """, {'cutoff': cutoff})
+        rates = cursor.fetchall()
+        if not rates:
+            return 0
+        
+        cursor.execute(
+            "INSERT INTO requests (timestamp, request_type, status, rates_changed) "
+            "VALUES (%s, 'carry_forward', 'success', %s) RETURNING id;",
+            (cutoff, len(rates))
+        )
+        request_id = cursor.fetchone()['id']
+        execute_values(
+            cursor,
+            "INSERT INTO responses (request_id, currency_code, rate, timestamp) VALUES %s;",
+            [(request_id, row['currency_code'], row['rate'], cutoff) for row in rates]
+        )
+        return len(rates)
+    
+    def maintain_storage(self) -> bool:
+        """Create upcoming partitions and drop expired ones after downsampling them"""
+        try:
+            with self._transaction() as cursor:
+                self.partitioned = self._is_partitioned(cursor)
+                if not self.partitioned:
+                    if STORAGE_CONFIG['retention_months'] > 0:
+                        log_warning(logger, "Retention requires a partitioned responses table, skipping")
+                    return True
+                self._ensure_partitions(cursor)
+            
+            retention_months = STORAGE_CONFIG['retention_months']
+            if retention_months <= 0:
+                return True
+            
+            cutoff = retention_cutoff()
+            cutoff_time = datetime.combine(cutoff, datetime.min.time())
+            with self._transaction() as cursor:
+                partitions = self._list_partitions(cursor)
+                if any(add_months(month, 1) <= cutoff for month in partitions):
+                    self._ensure_partitions(cursor, cutoff, cutoff)
+                    carried = self._carry_forward_rates(cursor, cutoff_time)
+                    if carried:
+                        log_info(logger, "Carried %d unchanged rates forward to %s", carried, cutoff)
+            
+            for month, partition in sorted(partitions.items()):
+                if add_months(month, 1) > cutoff:
+                    continue
+                with self._transaction() as cursor:
+                    rolled_up = self._rollup_from_raw(cursor, 'day', False, source=partition)
+                    cursor.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(partition)))
+                log_info(logger, "Dropped partition %s after rolling up %d daily rows", partition, rolled_up)
+            
+            with self._transaction() as cursor:
+                cursor.execute("DELETE FROM requests WHERE timestamp < %s;", (cutoff_time,))
+                if cursor.rowcount:
+                    log_info(logger, "Removed %d expired requests", cursor.rowcount)
+                cursor.execute(
+                    f"DELETE FROM {ROLLUP_TABLES['hour']} WHERE bucket < %s;",
+                    (cutoff_time,)
+                )
+            
+            return True
+            
+        except Exception as e:
+            log_error(logger, "Error maintaining storage", e)
+            return False
+    
+    def _seed_latest_rates(self, cursor):
+        """Fill an empty latest_rates table once from the responses history"""
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM latest_rates) AS seeded;")
+        if cursor.fetchone()['seeded']:
+            return
+        
+        query = """
+        INSERT INTO latest_rates
+            (currency_code, rate, timestamp, request_id, previous_rate, previous_timestamp)
+        SELECT currency_code, rate, timestamp, request_id, previous_rate, previous_timestamp
+        FROM (
+            SELECT
+                res.currency_code,
+                res.rate,
+                res.timestamp,
+                res.request_id,
+                LEAD(res.rate) OVER w AS previous_rate,
+                LEAD(res.timestamp) OVER w AS previous_timestamp,
+                ROW_NUMBER() OVER w AS position
+            FROM responses res
+            JOIN requests r ON res.request_id = r.id
+            WHERE r.status = 'success'
+            WINDOW w AS (PARTITION BY res.currency_code ORDER BY res.timestamp DESC)
+        ) ranked
+        WHERE position = 1
+        ON CONFLICT (currency_code) DO NOTHING;
+        """
+        cursor.execute(query)
+        if cursor.rowcount:
+            log_info(logger, "Seeded latest_rates with %d currencies", cursor.rowcount)
+    
+    @timed_query('insert_request')
     def insert_request(self, request_type: str, status: str, error_message: Optional[str] = None) -> Optional[int]:
-        """Insert request record and return its ID"""
         try:
             query = """
             INSERT INTO requests (request_type, status, error_message)
             VALUES (%s, %s, %s)
             RETURNING id;
             """
-            self.cursor.execute(query, (request_type, status, error_message))
-            request_id = self.cursor.fetchone()['id']
-            self.connection.commit()
+            with self._transaction() as cursor:
+                cursor.execute(query, (request_type, status, error_message))
+                request_id = cursor.fetchone()['id']
             return request_id
         except Exception as e:
             log_error(logger, "Error inserting request", e)
-            if self.connection:
-                self.connection.rollback()
             return None
     
-    def insert_currency_rates(self, request_id: int, rates: Dict[str, float]) -> bool:
-        """Insert currency rates"""
-        try:
-            query = """
-            INSERT INTO responses (request_id, currency_code, rate)
-            VALUES (%s, %s, %s);
+    def _write_rates(self, cursor, request_id: int, rates: Dict[str, float]):
+        """Write all rates of one request in a single round trip"""
+        rows = [(request_id, currency, float(rate)) for currency, rate in rates.items()]
+        count_rows_written(len(rows))
+        
+        if len(rows) >= INGEST_CONFIG['copy_threshold']:
+            buffer = io.StringIO(''.join(
+                f"{row_request_id}\t{currency}\t{rate!r}\n"
+                for row_request_id, currency, rate in rows
+            ))
+            cursor.copy_expert(
+                "COPY responses (request_id, currency_code, rate) FROM STDIN;",
+                buffer
+            )
+        else:
+            execute_values(
+                cursor,
+                "INSERT INTO responses (request_id, currency_code, rate) VALUES %s;",
+                rows,
+                page_size=len(rows)
+            )
+    
+    def _upsert_latest_rates(self, cursor, request_id: int, rates: Dict[str, float]):
+        """Keep latest_rates current, moving the replaced value into previous_rate"""
+        query = """
+        INSERT INTO latest_rates (currency_code, rate, timestamp, request_id)
+        VALUES %s
+        ON CONFLICT (currency_code) DO UPDATE SET
+            previous_rate = latest_rates.rate,
+            previous_timestamp = latest_rates.timestamp,
+            rate = EXCLUDED.rate,
+            timestamp = EXCLUDED.timestamp,
+            request_id = EXCLUDED.request_id
+        WHERE EXCLUDED.timestamp >= latest_rates.timestamp;
+        """
+        execute_values(
+            cursor,
+            query,
+            [(currency, float(rate), request_id) for currency, rate in rates.items()],
+            template="(%s, %s, LOCALTIMESTAMP, %s)",
+            page_size=len(rates)
+        )
+    
+    def _update_rollups(self, cursor, rates: Dict[str, float]):
+        """Fold one batch of rates into the hourly and daily OHLC rollups"""
+        rows = [
+            (currency, rate, rate, rate, rate, rate, rate * rate)
+            for currency, rate in ((currency, float(rate)) for currency, rate in rates.items())
+        ]
+        for unit, table in ROLLUP_TABLES.items():
+            query = f"""
+            INSERT INTO {table} AS t (
+                currency_code, bucket, open_rate, high_rate, low_rate, close_rate,
+                open_time, close_time, sample_count, rate_sum, rate_sum_sq
+            )
+            VALUES %s
+            ON CONFLICT (currency_code, bucket) DO UPDATE SET
+                open_rate = CASE WHEN EXCLUDED.open_time < t.open_time
+                                 THEN EXCLUDED.open_rate ELSE t.open_rate END,
+                open_time = LEAST(t.open_time, EXCLUDED.open_time),
+                high_rate = GREATEST(t.high_rate, EXCLUDED.high_rate),
+                low_rate = LEAST(t.low_rate, EXCLUDED.low_rate),
+                close_rate = CASE WHEN EXCLUDED.close_time >= t.close_time
+                                  THEN EXCLUDED.close_rate ELSE t.close_rate END,
+                close_time = GREATEST(t.close_time, EXCLUDED.close_time),
+                sample_count = t.sample_count + EXCLUDED.sample_count,
+                rate_sum = t.rate_sum + EXCLUDED.rate_sum,
+                rate_sum_sq = t.rate_sum_sq + EXCLUDED.rate_sum_sq;
             """
+            template = (
+                f"(%s, date_trunc('{unit}', LOCALTIMESTAMP), %s, %s, %s, %s, "
+                "LOCALTIMESTAMP, LOCALTIMESTAMP, 1, %s, %s)"
+            )
+            execute_values(cursor, query, rows, template=template, page_size=len(rows))
+    
+    def _drop_response_indexes(self, cursor) -> int:
+        for name in RESPONSE_INDEXES:
+            cursor.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(name)))
+        return len(RESPONSE_INDEXES)
+    
+    def _create_response_indexes(self, cursor):
+        for name, columns in RESPONSE_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns};")
+        cursor.execute("ANALYZE responses;")
+    
+    def _bulk_load_rates(self, ticks: List[Tuple[datetime, Dict[str, float]]], request_type: str) -> int:
+        """Rates are streamed into responses with COPY"""
+        with self._transaction() as cursor:
+            if self.partitioned:
+                for month in sorted({timestamp.date().replace(day=1) for timestamp, _ in ticks}):
+                    self._ensure_partitions(cursor, month, month)
             
-            for currency, rate in rates.items():
-                self.cursor.execute(query, (request_id, currency, float(rate)))
+            request_ids = execute_values(
+                cursor,
+                "INSERT INTO requests (timestamp, request_type, status, rates_changed) VALUES %s RETURNING id;",
+                [(timestamp, request_type, 'success', len(rates)) for timestamp, rates in ticks],
+                page_size=len(ticks),
+                fetch=True
+            )
             
-            self.connection.commit()
-            log_info(logger, f"Successfully saved {len(rates)} currency rates")
-            return True
+            buffer = io.StringIO()
+            newest: Dict[str, Tuple[datetime, float, int]] = {}
+            rows = 0
+            for (timestamp, rates), request in zip(ticks, request_ids):
+                stamp = timestamp.isoformat(sep=' ')
+                for currency, rate in rates.items():
+                    rate = float(rate)
+                    buffer.write(f"{request['id']}\t{currency}\t{rate!r}\t{stamp}\n")
+                    if currency not in newest or newest[currency][0] < timestamp:
+                        newest[currency] = (timestamp, rate, request['id'])
+                rows += len(rates)
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY responses (request_id, currency_code, rate, timestamp) FROM STDIN;",
+                buffer
+            )
             
-        except Exception as e:
-            log_error(logger, "Error inserting currency rates", e)
-            if self.connection:
-                self.connection.rollback()
-            return False
+            execute_values(
+                cursor,
+                """
+                INSERT INTO latest_rates (currency_code, rate, timestamp, request_id)
+                VALUES %s
+                ON CONFLICT (currency_code) DO UPDATE SET
+                    previous_rate = latest_rates.rate,
+                    previous_timestamp = latest_rates.timestamp,
+                    rate = EXCLUDED.rate,
+                    timestamp = EXCLUDED.timestamp,
+                    request_id = EXCLUDED.request_id
+                WHERE EXCLUDED.timestamp > latest_rates.timestamp;
+                """,
+                [(currency, rate, timestamp, request_id) for currency, (timestamp, rate, request_id) in newest.items()],
+                page_size=len(newest)
+            )
+        
+        count_rows_written(rows)
+        return rows
+    
+    def _load_last_stored(self, cursor) -> Dict[str, float]:
+        cursor.execute("SELECT currency_code, rate FROM latest_rates;")
+        return {row['currency_code']: float(row['rate']) for row in cursor.fetchall()}
     
+    def _write_outcome(self, cursor, request_id: int, status: str, error_message: Optional[str],
+                       rates_changed: Optional[int], stored_rates: Optional[Dict[str, float]],
+                       rates: Optional[Dict[str, float]]) -> datetime:
+        cursor.execute("""
+        UPDATE requests
+        SET status = %s, error_message = %s, rates_changed = %s
+        WHERE id = %s
+        RETURNING LOCALTIMESTAMP AS recorded_at;
+        """, (status, error_message, rates_changed, request_id))
+        recorded_at = cursor.fetchone()['recorded_at']
+        if stored_rates:
+            self._write_rates(cursor, request_id, stored_rates)
+            if status == 'success':
+                self._upsert_latest_rates(cursor, request_id, stored_rates)
+        if rates and status == 'success':
+            self._update_rollups(cursor, rates)
+        return recorded_at
+    
+    @timed_query('get_request_history')
     def get_request_history(self) -> List[Dict]:
-        """Get request history with JOIN data"""
         try:
+            # Pick the latest requests first so only their responses are joined
             query = """
+            WITH recent AS (
+                SELECT id, timestamp, request_type, status, error_message, rates_changed
+                FROM requests
+                ORDER BY timestamp DESC
+                LIMIT 100
+            )
             SELECT 
                 r.id as request_id,
                 r.timestamp as request_time,
                 r.request_type,
                 r.status,
                 r.error_message,
+                r.rates_changed,
                 COUNT(res.id) as currency_count,
                 STRING_AGG(
                     res.currency_code || ': ' || res.rate::TEXT, 
                     ', '
                 ) as currency_rates
-            FROM requests r
+            FROM recent r
             LEFT JOIN responses res ON r.id = res.request_id
-            GROUP BY r.id, r.timestamp, r.request_type, r.status, r.error_message
-            ORDER BY r.timestamp DESC
-            LIMIT 100;
+            GROUP BY r.id, r.timestamp, r.request_type, r.status, r.error_message, r.rates_changed
+            ORDER BY r.timestamp DESC;
             """
             
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
+            with self._transaction() as cursor:
+                cursor.execute(query)
+                results = cursor.fetchall()
             return [dict(row) for row in results]
             
         except Exception as e:
             log_error(logger, "Error getting request history", e)
             return []
     
-    def get_latest_rates(self) -> List[Dict]:
-        """Get latest currency rates"""
+    def _query_latest_rates(self) -> List[Dict]:
+        query = """
+        SELECT
+            currency_code,
+            rate,
+            timestamp,
+            'success' AS status
+        FROM latest_rates
+        ORDER BY currency_code;
+        """
+        
+        with self._transaction() as cursor:
+            cursor.execute(query)
+            return cursor.fetchall()
+    
+    @timed_query('get_rate_history')
+    def get_rate_history(self, currency_code: str, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, limit: int = 1000) -> List[Dict]:
+        try:
+            query = """
+            SELECT
+                res.rate,
+                res.timestamp
+            FROM responses res
+            JOIN requests r ON res.request_id = r.id
+            WHERE r.status = 'success'
+              AND res.currency_code = %s
+              AND (%s::TIMESTAMP IS NULL OR res.timestamp >= %s)
+              AND (%s::TIMESTAMP IS NULL OR res.timestamp < %s)
+            ORDER BY res.timestamp DESC
+            LIMIT %s;
+            """
+            
+            with self._transaction() as cursor:
+                cursor.execute(query, (currency_code, start, start, end, end, limit))
+                results = cursor.fetchall()
+            return [dict(row) for row in results]
+            
+        except Exception as e:
+            log_error(logger, "Error getting rate history", e)
+            return []
+    
+    def iter_rate_history(self, currency_codes: Optional[Sequence[str]] = None,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          after: Optional[Tuple[datetime, int]] = None, descending: bool = False,
+                          page_size: int = 5000) -> Iterator[Dict]:
+        """Each page is read through a server-side cursor in its own short transaction"""
+        order, direction = ('DESC', '<') if descending else ('ASC', '>')
+        query = sql.SQL("""
+        SELECT
+            res.id,
+            res.request_id,
+            res.currency_code,
+            res.rate,
+            res.timestamp
+        FROM responses res
+        JOIN requests r ON res.request_id = r.id
+        WHERE r.status = 'success'
+          AND (%(codes)s::VARCHAR[] IS NULL OR res.currency_code = ANY(%(codes)s))
+          AND (%(start)s::TIMESTAMP IS NULL OR res.timestamp >= %(start)s)
+          AND (%(end)s::TIMESTAMP IS NULL OR res.timestamp < %(end)s)
+          AND (%(after_ts)s::TIMESTAMP IS NULL OR (res.timestamp, res.id) {direction} (%(after_ts)s, %(after_id)s))
+        ORDER BY res.timestamp {order}, res.id {order}
+        LIMIT %(page_size)s;
+        """).format(direction=sql.SQL(direction), order=sql.SQL(order))
+        
+        params = {
+            'codes': list(currency_codes) if currency_codes else None,
+            'start': start,
+            'end': end,
+            'after_ts': after[0] if after else None,
+            'after_id': after[1] if after else None,
+            'page_size': page_size,
+        }
+        while True:
+            with query_timer('iter_rate_history'), self._transaction(cursor_name='rate_history_page') as cursor:
+                cursor.itersize = page_size
+                cursor.execute(query, params)
+                page = [dict(row) for row in cursor]
+            
+            yield from page
+            if len(page) < page_size:
+                return
+            params['after_ts'], params['after_id'] = page[-1]['timestamp'], page[-1]['id']
+    
+    @timed_query('get_recent_rates')
+    def get_recent_rates(self, points: int) -> List[Dict]:
         try:
             query = """
-            WITH latest_requests AS (
-                SELECT DISTINCT ON (res.currency_code) 
-                    res.currency_code,
-                    res.rate,
-                    res.timestamp,
-                    r.status
+            SELECT
+                latest.currency_code,
+                recent.rate,
+                recent.timestamp
+            FROM latest_rates latest
+            CROSS JOIN LATERAL (
+                SELECT res.rate, res.timestamp
                 FROM responses res
-                JOIN requests r ON res.request_id = r.id
-                WHERE r.status = 'success'
-                ORDER BY res.currency_code, res.timestamp DESC
-            )
-            SELECT * FROM latest_requests
-            ORDER BY currency_code;
+                WHERE res.currency_code = latest.currency_code
+                ORDER BY res.timestamp DESC
+                LIMIT %s
+            ) recent
+            ORDER BY recent.timestamp, latest.currency_code;
+            """
+            
+            with self._transaction() as cursor:
+                cursor.execute(query, (points,))
+                results = cursor.fetchall()
+            return [dict(row) for row in results]
+            
+        except Exception as e:
+            log_error(logger, "Error getting recent rates", e)
+            return []
+    
+    @timed_query('get_rates_as_of')
+    def get_rates_as_of(self, moment: datetime) -> List[Dict]:
+        try:
+            query = """
+            SELECT DISTINCT ON (res.currency_code)
+                res.currency_code,
+                res.rate,
+                res.timestamp
+            FROM responses res
+            JOIN requests r ON res.request_id = r.id
+            WHERE r.status = 'success' AND res.timestamp <= %s
+            ORDER BY res.currency_code, res.timestamp DESC;
             """
             
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
+            with self._transaction() as cursor:
+                cursor.execute(query, (moment,))
+                results = cursor.fetchall()
             return [dict(row) for row in results]
             
         except Exception as e:
-            log_error(logger, "Error getting latest rates", e)
+            log_error(logger, "Error getting rates as of date", e)
             return []
+    
+    @timed_query('get_rate_changes')
+    def get_rate_changes(self) -> List[Dict]:
+        try:
+            query = """
+            SELECT
+                currency_code,
+                rate AS current_rate,
+                timestamp AS current_time,
+                previous_rate,
+                previous_timestamp AS previous_time,
+                ROUND(((rate - previous_rate) / previous_rate * 100), 4) AS percentage_change
+            FROM latest_rates
+            WHERE previous_rate IS NOT NULL AND previous_rate <> 0
+            ORDER BY ABS((rate - previous_rate) / previous_rate) DESC;
+            """
+            
+            with self._transaction() as cursor:
+                cursor.execute(query)
+                results = cursor.fetchall()
+            return [dict(row) for row in results]
+            
+        except Exception as e:
+            log_error(logger, "Error getting rate changes", e)
+            return []
+
+    @timed_query('rollup')
+    def _query_rollup(self, query: str, params: tuple, error_message: str) -> List[Dict]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(query, params)
+                results = cursor.fetchall()
+            return [dict(row) for row in results]
+        except Exception as e:
+            log_error(logger, error_message, e)
+            return []
+    
+    def get_daily_trends(self, currency_code: Optional[str] = None, days: int = 30) -> List[Dict]:
+        query = f"""
+        SELECT
+            currency_code,
+            bucket::DATE AS date,
+            open_rate,
+            high_rate AS max_rate,
+            low_rate AS min_rate,
+            close_rate,
+            rate_sum / sample_count AS avg_rate,
+            {ROLLUP_STDDEV} AS rate_stddev,
+            sample_count
+        FROM {ROLLUP_TABLES['day']}
+        WHERE bucket >= date_trunc('day', LOCALTIMESTAMP) - make_interval(days => %s)
+          AND (%s::VARCHAR IS NULL OR currency_code = %s)
+        ORDER BY currency_code, bucket DESC;
+        """
+        return self._query_rollup(query, (days, currency_code, currency_code), "Error getting daily trends")
+    
+    def get_hourly_stats(self, currency_code: Optional[str] = None, hours: int = 24) -> List[Dict]:
+        query = f"""
+        SELECT
+            currency_code,
+            bucket AS hour,
+            open_rate,
+            high_rate,
+            low_rate,
+            close_rate,
+            rate_sum / sample_count AS avg_rate,
+            {ROLLUP_STDDEV} AS rate_stddev,
+            sample_count
+        FROM {ROLLUP_TABLES['hour']}
+        WHERE bucket >= date_trunc('hour', LOCALTIMESTAMP) - make_interval(hours => %s)
+          AND (%s::VARCHAR IS NULL OR currency_code = %s)
+        ORDER BY currency_code, bucket DESC;
+        """
+        return self._query_rollup(query, (hours, currency_code, currency_code), "Error getting hourly stats")
+    
+    def get_volatility_ranking(self) -> List[Dict]:
+        query = f"""
+        WITH totals AS (
+            SELECT
+                currency_code,
+                SUM(sample_count) AS sample_count,
+                SUM(rate_sum) AS rate_sum,
+                SUM(rate_sum_sq) AS rate_sum_sq,
+                MIN(low_rate) AS min_rate,
+                MAX(high_rate) AS max_rate
+            FROM {ROLLUP_TABLES['day']}
+            GROUP BY currency_code
+        )
+        SELECT
+            currency_code,
+            sample_count AS data_points,
+            ROUND((rate_sum / sample_count)::NUMERIC, 6) AS average_rate,
+            ROUND(({ROLLUP_STDDEV})::NUMERIC, 6) AS rate_volatility,
+            ROUND(min_rate, 6) AS min_rate,
+            ROUND(max_rate, 6) AS max_rate
+        FROM totals
+        ORDER BY rate_volatility ASC NULLS LAST;
+        """
+        return self._query_rollup(query, (), "Error getting volatility ranking")
+
+def create_storage() -> StorageBackend:
+    """Storage backend selected by STORAGE_BACKEND"""
+    backend = STORAGE_CONFIG['backend']
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(STORAGE_CONFIG['sqlite_path'])
+    if backend == 'postgres':
+        return DatabaseManager()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected 'postgres' or 'sqlite'")
 
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = create_storage()
\ No newline at end of file
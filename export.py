@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Columnar export of stored rates into memory-mappable NumPy files.
+
+Each column is one raw little-endian file next to a manifest.json that records
+dtypes, the row count and the (timestamp, id) keyset of the last exported row.
+Re-running appends only rows stored after that keyset. Rows written later with
+older timestamps need a --full re-export: backfills, and the carry_forward rows
+that retention maintenance stores at its cutoff under delta storage.
+
+    python export.py --output export
+    rates = load_export('export'); rates['rate'][rates['currency_code'] == b'EUR']
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional
+from logger import logger, log_error, log_info
+from config import EXPORT_CONFIG
+from database import db_manager
+
+MANIFEST_FILE = 'manifest.json'
+FORMAT_VERSION = 1
+
+# Column name -> NumPy dtype of its file
+COLUMNS = {
+    'id': '<i8',
+    'request_id': '<i8',
+    'timestamp': '<M8[us]',
+    'currency_code': 'S3',
+    'rate': '<f8',
+}
+
+def _column_path(directory: str, column: str) -> str:
+    return os.path.join(directory, f"{column}.bin")
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_manifest(directory: str, manifest: Dict):
+    """Replace the manifest atomically so readers never see a partial one"""
+    path = os.path.join(directory, MANIFEST_FILE)
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def _new_manifest(currency_codes: Optional[List[str]]) -> Dict:
+    return {
+        'version': FORMAT_VERSION,
+        'rows': 0,
+        'columns': {name: {'file': f"{name}.bin", 'dtype': dtype} for name, dtype in COLUMNS.items()},
+        'currencies': currency_codes,
+        'last_keyset': None,
+        'updated_at': None,
+    }
+
+def _truncate_columns(directory: str, rows: int):
+    """Drop rows appended by an export that stopped before updating the manifest"""
+    for column, dtype in COLUMNS.items():
+        path = _column_path(directory, column)
+        size = rows * np.dtype(dtype).itemsize
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        if os.path.getsize(path) != size:
+            os.truncate(path, size)
+
+def _page_arrays(page: List[Dict]) -> Dict[str, np.ndarray]:
+    return {
+        'id': np.fromiter((row['id'] for row in page), dtype=COLUMNS['id'], count=len(page)),
+        'request_id': np.fromiter((row['request_id'] for row in page), dtype=COLUMNS['request_id'], count=len(page)),
+        'timestamp': np.array([row['timestamp'] for row in page], dtype=COLUMNS['timestamp']),
+        'currency_code': np.array([row['currency_code'].encode('ascii') for row in page], dtype=COLUMNS['currency_code']),
+        'rate': np.fromiter((float(row['rate']) for row in page), dtype=COLUMNS['rate'], count=len(page)),
+    }
+
+def export_rates(directory: str, currency_codes: Optional[List[str]] = None,
+                 full: bool = False, page_size: int = 50000) -> int:
+    """Append rows stored since the last export; returns the number of rows added"""
+    os.makedirs(directory, exist_ok=True)
+    manifest = None if full else read_manifest(directory)
+    if manifest is None:
+        manifest = _new_manifest(currency_codes)
+    elif manifest['version'] != FORMAT_VERSION or manifest['currencies'] != currency_codes:
+        raise ValueError("Existing export has a different format or currency filter, use --full")
+
+    _truncate_columns(directory, manifest['rows'])
+    after = None
+    if manifest['last_keyset']:
+        after = (datetime.fromisoformat(manifest['last_keyset'][0]), manifest['last_keyset'][1])
+
+    files = {column: open(_column_path(directory, column), 'ab') for column in COLUMNS}
+    added = 0
+    page = []
+    try:
+        rows = db_manager.iter_rate_history(currency_codes, after=after, page_size=page_size)
+        for row in rows:
+            page.append(row)
+            if len(page) < page_size:
+                continue
+            added += _append_page(files, page, manifest)
+            page = []
+        if page:
+            added += _append_page(files, page, manifest)
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest['rows'] += added
+    manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    _write_manifest(directory, manifest)
+    return added
+
+def _append_page(files: Dict, page: List[Dict], manifest: Dict) -> int:
+    for column, values in _page_arrays(page).items():
+        files[column].write(values.tobytes())
+    last = page[-1]
+    manifest['last_keyset'] = [last['timestamp'].isoformat(), last['id']]
+    return len(page)
+
+def load_export(directory: str) -> Dict[str, np.ndarray]:
+    """Read-only memory maps of every exported column, sized by the manifest"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No export manifest in {directory}")
+
+    rows = manifest['rows']
+    columns = {}
+    for column, spec in manifest['columns'].items():
+        dtype = np.dtype(spec['dtype'])
+        if rows == 0:
+            columns[column] = np.empty(0, dtype=dtype)
+        else:
+            columns[column] = np.memmap(os.path.join(directory, spec['file']), dtype=dtype, mode='r', shape=(rows,))
+    return columns
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored rates to memory-mappable column files")
+    parser.add_argument('--output', default=EXPORT_CONFIG['directory'], help="export directory")
+    parser.add_argument('--currencies', help="comma-separated currency codes, all by default")
+    parser.add_argument('--full', action='store_true', help="rewrite the export from scratch")
+    parser.add_argument('--page-size', type=int, default=EXPORT_CONFIG['page_size'], help="rows per database page")
+    args = parser.parse_args()
+
+    currency_codes = [code.strip().upper() for code in args.currencies.split(',')] if args.currencies else None
+    if not db_manager.connect():
+        return 1
+    try:
+        added = export_rates(args.output, currency_codes, args.full, args.page_size)
+        log_info(logger, "Exported %d new rows to %s (%d total)", added, args.output, read_manifest(args.output)['rows'])
+        return 0
+    except Exception as e:
+        log_error(logger, "Export failed", e)
+        return 1
+    finally:
+        db_manager.disconnect()
+
+if __name__ == "__main__":
+    sys.exit(main())
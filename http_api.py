@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import math
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import metrics
+from logger import logger, log_error, log_info
+from config import API_CONFIG, HTTP_CONFIG
+from database import db_manager
+from cross_rates import CrossRateMatrix
+from timeseries import rate_series
+
+Response = Tuple[int, bytes, Optional[str]]
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _serialize(payload: Dict) -> bytes:
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class RatesPublisher:
+    """Latest rates kept as pre-serialized JSON for the hot endpoints"""
+
+    def __init__(self):
+        # (body, etag, cross_rates, extra base bodies) replaced as one tuple so readers never see a mix
+        self.state: Tuple[bytes, Optional[str], Optional[CrossRateMatrix], Dict[str, Tuple[bytes, str]]] = (
+            _serialize({'error': 'No rates available yet'}), None, None, {}
+        )
+
+    def publish(self, latest_rates: List[Dict], cross_rates: Optional[CrossRateMatrix] = None,
+                base_rates: Optional[Dict[str, Dict[str, float]]] = None, base_rates_at: Optional[datetime] = None):
+        """Swap in a new snapshot; rebuilds the cross-rate matrix if none is given.
+
+        base_rates holds the rates of the extra BASE_CURRENCIES fetched or
+        derived at base_rates_at, served by /rates/latest?base=.
+        """
+        base_currency = API_CONFIG['base_currency']
+        rates = {row['currency_code']: float(row['rate']) for row in latest_rates}
+        if cross_rates is None and rates:
+            cross_rates = CrossRateMatrix(base_currency, rates)
+
+        body = _serialize({
+            'base': base_currency,
+            'rates': rates,
+            'timestamps': {row['currency_code']: row['timestamp'] for row in latest_rates},
+        })
+
+        base_bodies = {}
+        for base, rates in (base_rates or {}).items():
+            base_body = _serialize({
+                'base': base,
+                'rates': rates,
+                'timestamps': {currency: base_rates_at for currency in rates},
+            })
+            base_bodies[base] = (base_body, _etag(base_body))
+        self.state = (body, _etag(body), cross_rates, base_bodies)
+
+class RatesRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'CurrencyTracker/1.0'
+    # Buffer headers and body into one write and send it without Nagle delays
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parsed = urlsplit(self.path)
+        if parsed.path == '/metrics' and metrics.ENABLED:
+            self._send(200, metrics.registry.render().encode('utf-8'), None, METRICS_CONTENT_TYPE)
+            return
+        route = ROUTES.get(parsed.path.rstrip('/') or '/')
+        if route is None:
+            self._send(404, _serialize({'error': 'Not found'}), None)
+            return
+
+        try:
+            status, body, etag = route(self, parse_qs(parsed.query))
+        except ValueError as e:
+            status, body, etag = 400, _serialize({'error': str(e)}), None
+        except Exception as e:
+            log_error(logger, "HTTP API request failed", e)
+            status, body, etag = 500, _serialize({'error': 'Internal server error'}), None
+
+        self._send(status, body, etag)
+
+    def _send(self, status: int, body: bytes, etag: Optional[str], content_type: str = 'application/json'):
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("HTTP %s - %s", self.address_string(), format % args)
+
+    def handle_health(self, params: Dict) -> Response:
+        return 200, b'{"status":"ok"}', None
+
+    def handle_latest(self, params: Dict) -> Response:
+        body, etag, _, base_bodies = rates_publisher.state
+        base = _param(params, 'base', API_CONFIG['base_currency']).upper()
+        if base != API_CONFIG['base_currency']:
+            if base not in base_bodies:
+                return 404, _serialize({'error': f"No rates for base {base}, see BASE_CURRENCIES"}), None
+            body, etag = base_bodies[base]
+        if etag is None:
+            return 503, body, None
+        return 200, body, etag
+
+    def handle_convert(self, params: Dict) -> Response:
+        from_currency = _param(params, 'from').upper()
+        to_currency = _param(params, 'to').upper()
+        amount = float(_param(params, 'amount', '1'))
+        if not math.isfinite(amount):
+            raise ValueError("amount must be a finite number")
+
+        _, snapshot_etag, cross_rates, _ = rates_publisher.state
+        if cross_rates is None:
+            return 503, _serialize({'error': 'No rates available yet'}), None
+
+        rate = cross_rates.rate(from_currency, to_currency)
+        result = amount * rate
+        if not math.isfinite(result):
+            raise ValueError("amount is too large to convert")
+        body = _serialize({
+            'from': from_currency,
+            'to': to_currency,
+            'amount': amount,
+            'rate': rate,
+            'result': result,
+        })
+        return 200, body, _etag(snapshot_etag.encode('utf-8') + body)
+
+    def handle_history(self, params: Dict) -> Response:
+        currency_code = _param(params, 'currency').upper()
+        start = _param_datetime(params, 'start')
+        end = _param_datetime(params, 'end')
+        limit = min(int(_param(params, 'limit', str(HTTP_CONFIG['history_limit']))), HTTP_CONFIG['history_limit'])
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        if not db_manager.is_connected():
+            # Non-resident services only connect for the duration of a tick
+            return 503, _serialize({'error': 'Database is not connected'}), None
+
+        rows = db_manager.get_rate_history(currency_code, start, end, limit)
+        body = _serialize({
+            'currency': currency_code,
+            'history': [{'rate': float(row['rate']), 'timestamp': row['timestamp']} for row in rows],
+        })
+        return 200, body, _etag(body)
+
+    def handle_stats(self, params: Dict) -> Response:
+        currency_code = _param(params, 'currency').upper()
+        points = params.get('points')
+        seconds = params.get('seconds')
+        stats = rate_series.stats(
+            currency_code,
+            points=int(points[0]) if points else None,
+            seconds=float(seconds[0]) if seconds else None
+        )
+        if stats is None:
+            return 404, _serialize({'error': f"No in-memory series for {currency_code}"}), None
+        return 200, _serialize(dict(stats, currency=currency_code)), None
+
+ROUTES = {
+    '/health': RatesRequestHandler.handle_health,
+    '/rates/latest': RatesRequestHandler.handle_latest,
+    '/convert': RatesRequestHandler.handle_convert,
+    '/rates/history': RatesRequestHandler.handle_history,
+    '/rates/stats': RatesRequestHandler.handle_stats,
+}
+
+def _param(params: Dict, name: str, default: Optional[str] = None) -> str:
+    values = params.get(name)
+    if values:
+        return values[0]
+    if default is None:
+        raise ValueError(f"Missing query parameter: {name}")
+    return default
+
+def _param_datetime(params: Dict, name: str) -> Optional[datetime]:
+    values = params.get(name)
+    if not values:
+        return None
+    try:
+        return datetime.fromisoformat(values[0])
+    except ValueError:
+        raise ValueError(f"Invalid ISO timestamp for {name}: {values[0]}") from None
+
+def start_http_server() -> ThreadingHTTPServer:
+    """Serve the read-only rates API from a background thread"""
+    server = ThreadingHTTPServer((HTTP_CONFIG['host'], HTTP_CONFIG['port']), RatesRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='rates-http', daemon=True)
+    thread.start()
+    log_info(logger, "HTTP rates API listening on %s:%s", HTTP_CONFIG['host'], HTTP_CONFIG['port'])
+    return server
+
+rates_publisher = RatesPublisher()
@@ -1,25 +1,69 @@
+import atexit
+import json
 import logging
 import logging.handlers
+import queue
 from datetime import datetime
 from config import LOGGING_CONFIG
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log shippers"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread with the message merged but not yet rendered"""
+
+    def prepare(self, record):
+        # The listener's formatters render the record; only args and exc_info,
+        # which may hold live objects, are resolved on the calling thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _create_formatter() -> logging.Formatter:
+    if LOGGING_CONFIG['log_format'] == 'json':
+        return JsonFormatter()
+    return logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
 def setup_logger():
-    """Setup logger for error recording to separate file"""
+    """Setup logger for error recording to separate file.
+    
+    Records are queued by the calling thread and written to the console and the
+    rotating error file by a background listener, so I/O never blocks callers.
+    """
     logger = logging.getLogger('currency_service')
     logger.setLevel(getattr(logging, LOGGING_CONFIG['log_level']))
     
     logger.handlers.clear()
     
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    formatter = _create_formatter()
     
     file_handler = logging.handlers.RotatingFileHandler(
         LOGGING_CONFIG['log_file'],
         maxBytes=10*1024*1024,
         backupCount=5,
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True
     )
     file_handler.setLevel(logging.ERROR)
     file_handler.setFormatter(formatter)
@@ -28,25 +72,31 @@ def setup_logger():
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(_QueueHandler(log_queue))
     
     return logger
 
 def log_error(logger, error_message, exception=None):
-    """Log errors with additional information"""
+    """Log errors with additional information; the exception is formatted lazily"""
     if exception:
-        logger.error(f"{error_message}: {str(exception)}")
+        logger.error('%s: %s', error_message, exception)
         logger.debug("Error details:", exc_info=True)
     else:
-        logger.error(error_message)
+        logger.error('%s', error_message)
 
-def log_info(logger, message):
-    """Log informational messages"""
-    logger.info(message)
+def log_info(logger, message, *args):
+    """Log informational messages; args are %-formatted lazily"""
+    logger.info(message, *args)
 
-def log_warning(logger, message):
-    """Log warning messages"""
-    logger.warning(message)
+def log_warning(logger, message, *args):
+    """Log warning messages; args are %-formatted lazily"""
+    logger.warning(message, *args)
 
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+from datetime import date
+from typing import Dict, List, Optional
+from logger import logger, log_warning
+from config import API_CONFIG
+
+class LatencyStats:
+    """Rolling latency samples and failure rate of one provider"""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, success: bool):
+        with self._lock:
+            if success:
+                self._samples.append(seconds)
+            self._outcomes.append(success)
+
+    @property
+    def sample_count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        position = min(int(round(percent / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[position]
+
+    def failure_rate(self) -> float:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+class RatesProvider:
+    """URL layout and payload schema of one exchange rates API.
+
+    parse_latest() normalizes a successful payload to the exchangerate-api
+    field names: conversion_rates, time_last_update_unix, time_next_update_unix.
+    """
+
+    name = 'provider'
+
+    def is_configured(self) -> bool:
+        return True
+
+    def latest_url(self, base_currency: str) -> str:
+        raise NotImplementedError
+
+    def history_url(self, base_currency: str, day: date) -> str:
+        raise NotImplementedError(f"{self.name} does not serve historical rates")
+
+    def parse_latest(self, data: Dict) -> Dict:
+        raise NotImplementedError
+
+class ExchangeRateAPIProvider(RatesProvider):
+    """exchangerate-api.com v6, authenticated with an API key in the path"""
+
+    name = 'exchangerate-api'
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url
+        self.api_key = api_key
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def latest_url(self, base_currency: str) -> str:
+        return f"{self.base_url}/{self.api_key}/latest/{base_currency}"
+
+    def history_url(self, base_currency: str, day: date) -> str:
+        return f"{self.base_url}/{self.api_key}/history/{base_currency}/{day.year}/{day.month}/{day.day}"
+
+    def parse_latest(self, data: Dict) -> Dict:
+        return {
+            'conversion_rates': data.get('conversion_rates', {}),
+            'time_last_update_unix': data.get('time_last_update_unix'),
+            'time_next_update_unix': data.get('time_next_update_unix'),
+        }
+
+class OpenERAPIProvider(RatesProvider):
+    """Keyless open.er-api.com endpoint of the same vendor"""
+
+    name = 'open-er-api'
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def latest_url(self, base_currency: str) -> str:
+        return f"{self.base_url}/latest/{base_currency}"
+
+    def parse_latest(self, data: Dict) -> Dict:
+        return {
+            'conversion_rates': data.get('rates', {}),
+            'time_last_update_unix': data.get('time_last_update_unix'),
+            'time_next_update_unix': data.get('time_next_update_unix'),
+        }
+
+def create_providers() -> List[RatesProvider]:
+    """Configured providers, primary first"""
+    providers = [ExchangeRateAPIProvider(API_CONFIG['base_url'], API_CONFIG['api_key'])]
+    secondary = API_CONFIG['secondary_provider']
+    if secondary == OpenERAPIProvider.name:
+        providers.append(OpenERAPIProvider(API_CONFIG['secondary_base_url']))
+    elif secondary:
+        log_warning(logger, "Unknown secondary provider: %s", secondary)
+    return providers
@@ -29,33 +29,29 @@ GROUP BY r.id, r.timestamp, r.status
 ORDER BY r.timestamp DESC;
 
 -- 3. Latest Rates for Each Currency
-WITH latest_rates AS (
-    SELECT DISTINCT ON (res.currency_code) 
-        res.currency_code,
-        res.rate,
-        res.timestamp,
-        r.status
-    FROM responses res
-    JOIN requests r ON res.request_id = r.id
-    WHERE r.status = 'success'
-    ORDER BY res.currency_code, res.timestamp DESC
-)
-SELECT * FROM latest_rates
+-- latest_rates is kept current by the ingestion transaction, so this does not
+-- scan the responses history
+SELECT 
+    currency_code,
+    rate,
+    timestamp,
+    request_id
+FROM latest_rates
 ORDER BY currency_code;
 
 -- 4. Currency Rate Trends Over Time
+-- rates_daily is updated incrementally on every ingested batch
 SELECT 
-    res.currency_code,
-    DATE(res.timestamp) as date,
-    AVG(res.rate) as avg_rate,
-    MIN(res.rate) as min_rate,
-    MAX(res.rate) as max_rate,
-    COUNT(*) as sample_count
-FROM responses res
-JOIN requests r ON res.request_id = r.id
-WHERE r.status = 'success'
-GROUP BY res.currency_code, DATE(res.timestamp)
-ORDER BY res.currency_code, date DESC;
+    currency_code,
+    bucket::DATE as date,
+    rate_sum / sample_count as avg_rate,
+    low_rate as min_rate,
+    high_rate as max_rate,
+    open_rate,
+    close_rate,
+    sample_count
+FROM rates_daily
+ORDER BY currency_code, date DESC;
 
 -- 5. Error Analysis and Request Success Rate
 SELECT 
@@ -72,35 +68,14 @@ GROUP BY DATE(r.timestamp)
 ORDER BY date DESC;
 
 -- 6. Currency Rate Comparison (Current vs Previous)
-WITH current_rates AS (
-    SELECT DISTINCT ON (res.currency_code)
-        res.currency_code,
-        res.rate as current_rate,
-        res.timestamp as current_time
-    FROM responses res
-    JOIN requests r ON res.request_id = r.id
-    WHERE r.status = 'success'
-    ORDER BY res.currency_code, res.timestamp DESC
-),
-previous_rates AS (
-    SELECT DISTINCT ON (res.currency_code)
-        res.currency_code,
-        res.rate as previous_rate,
-        res.timestamp as previous_time
-    FROM responses res
-    JOIN requests r ON res.request_id = r.id
-    WHERE r.status = 'success'
-    ORDER BY res.currency_code, res.timestamp DESC
-    OFFSET 1
-)
 SELECT 
-    c.currency_code,
-    c.current_rate,
-    p.previous_rate,
-    ROUND(((c.current_rate - p.previous_rate) / p.previous_rate * 100), 4) as percentage_change
-FROM current_rates c
-JOIN previous_rates p ON c.currency_code = p.currency_code
-ORDER BY ABS((c.current_rate - p.previous_rate) / p.previous_rate) DESC;
+    currency_code,
+    rate as current_rate,
+    previous_rate,
+    ROUND(((rate - previous_rate) / previous_rate * 100), 4) as percentage_change
+FROM latest_rates
+WHERE previous_rate IS NOT NULL AND previous_rate <> 0
+ORDER BY ABS((rate - previous_rate) / previous_rate) DESC;
 
 -- 7. Hourly Request Distribution
 SELECT 
@@ -113,17 +88,26 @@ GROUP BY EXTRACT(HOUR FROM r.timestamp)
 ORDER BY hour_of_day;
 
 -- 8. Top Performing Currencies (Most Stable)
+-- Mean and sample standard deviation are derived from the rollup sums
+WITH totals AS (
+    SELECT 
+        currency_code,
+        SUM(sample_count) as n,
+        SUM(rate_sum) as rate_sum,
+        SUM(rate_sum_sq) as rate_sum_sq,
+        MIN(low_rate) as min_rate,
+        MAX(high_rate) as max_rate
+    FROM rates_daily
+    GROUP BY currency_code
+)
 SELECT 
-    res.currency_code,
-    COUNT(*) as data_points,
-    ROUND(AVG(res.rate), 6) as average_rate,
-    ROUND(STDDEV(res.rate), 6) as rate_volatility,
-    ROUND(MIN(res.rate), 6) as min_rate,
-    ROUND(MAX(res.rate), 6) as max_rate
-FROM responses res
-JOIN requests r ON res.request_id = r.id
-WHERE r.status = 'success'
-GROUP BY res.currency_code
+    currency_code,
+    n as data_points,
+    ROUND((rate_sum / n)::NUMERIC, 6) as average_rate,
+    ROUND(SQRT(GREATEST((rate_sum_sq - rate_sum * rate_sum / n) / NULLIF(n - 1, 0), 0))::NUMERIC, 6) as rate_volatility,
+    ROUND(min_rate, 6) as min_rate,
+    ROUND(max_rate, 6) as max_rate
+FROM totals
 ORDER BY rate_volatility ASC;
 
 -- 9. Recent Activity Summary
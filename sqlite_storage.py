@@ -0,0 +1,695 @@
+import math
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from logger import logger, log_error, log_info
+from config import CACHE_CONFIG, STORAGE_CONFIG
+from storage import (
+    RESPONSE_INDEXES, ROLLUP_TABLES, StorageBackend, count_db_error, count_rows_written, query_timer,
+    retention_cutoff, rollup_stddev, timed_query
+)
+
+# Timestamps are stored as fixed-width ISO text so they sort and compare as strings
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' ', 'microseconds'))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()[:10]))
+
+# strftime() format that truncates a timestamp to each rollup unit, and the bucket length
+ROLLUP_BUCKETS = {
+    'hour': ('%Y-%m-%d %H:00:00.000000', timedelta(hours=1)),
+    'day': ('%Y-%m-%d 00:00:00.000000', timedelta(days=1)),
+}
+
+ROLLUP_STDDEV = rollup_stddev('MAX')
+
+# Idle reader connections kept open for the HTTP API and other reading threads
+MAX_IDLE_READERS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TIMESTAMP NOT NULL,
+    request_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error_message TEXT,
+    rates_changed INTEGER
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id INTEGER REFERENCES requests(id) ON DELETE CASCADE,
+    currency_code TEXT NOT NULL,
+    rate REAL NOT NULL,
+    timestamp TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest_rates (
+    currency_code TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    request_id INTEGER REFERENCES requests(id) ON DELETE SET NULL,
+    previous_rate REAL,
+    previous_timestamp TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests(timestamp);
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    currency_code TEXT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    open_rate REAL NOT NULL,
+    high_rate REAL NOT NULL,
+    low_rate REAL NOT NULL,
+    close_rate REAL NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    close_time TIMESTAMP NOT NULL,
+    sample_count INTEGER NOT NULL,
+    rate_sum REAL NOT NULL,
+    rate_sum_sq REAL NOT NULL,
+    PRIMARY KEY (currency_code, bucket)
+);
+"""
+
+ROLLUP_MERGE = """
+ON CONFLICT (currency_code, bucket) DO UPDATE SET
+    open_rate = CASE WHEN excluded.open_time < open_time THEN excluded.open_rate ELSE open_rate END,
+    open_time = MIN(open_time, excluded.open_time),
+    high_rate = MAX(high_rate, excluded.high_rate),
+    low_rate = MIN(low_rate, excluded.low_rate),
+    close_rate = CASE WHEN excluded.close_time >= close_time THEN excluded.close_rate ELSE close_rate END,
+    close_time = MAX(close_time, excluded.close_time),
+    sample_count = sample_count + excluded.sample_count,
+    rate_sum = rate_sum + excluded.rate_sum,
+    rate_sum_sq = rate_sum_sq + excluded.rate_sum_sq
+"""
+
+ROLLUP_REPLACE = """
+ON CONFLICT (currency_code, bucket) DO UPDATE SET
+    open_rate = excluded.open_rate,
+    high_rate = excluded.high_rate,
+    low_rate = excluded.low_rate,
+    close_rate = excluded.close_rate,
+    open_time = excluded.open_time,
+    close_time = excluded.close_time,
+    sample_count = excluded.sample_count,
+    rate_sum = excluded.rate_sum,
+    rate_sum_sq = excluded.rate_sum_sq
+"""
+
+def _sqrt(value):
+    return math.sqrt(value) if value is not None else None
+
+def _bucket(moment: datetime, unit: str) -> datetime:
+    return datetime.strptime(moment.strftime(ROLLUP_BUCKETS[unit][0]), TIMESTAMP_FORMAT)
+
+class SQLiteStorage(StorageBackend):
+    """Embedded single-file storage for edge nodes and CI.
+
+    Writes go through one connection behind a lock, as SQLite allows a single
+    writer per file. Reads use their own pooled connections, which WAL mode
+    lets run alongside the writer on the last committed state. With one
+    writer this replica is always the leader, and there are no partitions.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(CACHE_CONFIG['latest_rates_ttl_seconds'])
+        self.path = path
+        self.connection = None
+        self._lock = threading.RLock()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        # Bumped on every connect and disconnect so readers of an old session are closed
+        self._generation = 0
+
+    def _open(self, read_only: bool = False) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+        connection.row_factory = sqlite3.Row
+        connection.create_function('SQRT', 1, _sqrt, deterministic=True)
+        connection.execute("PRAGMA busy_timeout=5000;")
+        if read_only:
+            connection.execute("PRAGMA query_only=ON;")
+        else:
+            connection.execute("PRAGMA journal_mode=WAL;")
+            connection.execute("PRAGMA synchronous=NORMAL;")
+            connection.execute("PRAGMA foreign_keys=ON;")
+        return connection
+
+    def connect(self):
+        """Open the database file"""
+        try:
+            if self.is_connected():
+                self.disconnect()
+
+            self.connection = self._open()
+            self._generation += 1
+            log_info(logger, "Opened SQLite database %s", self.path)
+            return True
+        except Exception as e:
+            log_error(logger, "Database connection error", e)
+            return False
+
+    def disconnect(self):
+        """Close the database file"""
+        try:
+            with self._readers_lock:
+                self._generation += 1
+                readers, self._readers = self._readers, []
+            for reader in readers:
+                reader.close()
+            with self._lock:
+                if self.connection is not None:
+                    self.connection.close()
+            log_info(logger, "Database connection closed")
+        except Exception as e:
+            log_error(logger, "Error closing connection", e)
+        finally:
+            self.connection = None
+            self.is_leader = False
+
+    def is_connected(self) -> bool:
+        return self.connection is not None
+
+    def try_acquire_leadership(self) -> bool:
+        """A SQLite file has a single writer, so it is always the leader"""
+        self.is_leader = self.is_connected()
+        return self.is_leader
+
+    def release_leadership(self):
+        self.is_leader = False
+
+    def check_health(self) -> bool:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("SELECT 1;")
+            return True
+        except Exception as e:
+            log_error(logger, "Database health check failed", e)
+            return False
+
+    @contextmanager
+    def _transaction(self):
+        """Run one unit of work under the connection lock, committing on success"""
+        with self._lock:
+            if self.connection is None:
+                raise sqlite3.ProgrammingError("Database is not connected")
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute("BEGIN;")
+                yield cursor
+                cursor.execute("COMMIT;")
+            except Exception as e:
+                count_db_error(e)
+                if self.connection.in_transaction:
+                    self.connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _read_transaction(self):
+        """Run read-only work on a pooled reader connection without waiting for the writer"""
+        if self.path == ':memory:':
+            # Every connection to :memory: is a separate database
+            with self._transaction() as cursor:
+                yield cursor
+            return
+
+        with self._readers_lock:
+            if self.connection is None:
+                raise sqlite3.ProgrammingError("Database is not connected")
+            generation = self._generation
+            connection = self._readers.pop() if self._readers else None
+        if connection is None:
+            connection = self._open(read_only=True)
+
+        cursor = connection.cursor()
+        try:
+            # One snapshot for all statements of the unit of work
+            cursor.execute("BEGIN;")
+            yield cursor
+        except Exception as e:
+            count_db_error(e)
+            raise
+        finally:
+            cursor.close()
+            if connection.in_transaction:
+                connection.rollback()
+            with self._readers_lock:
+                keep = generation == self._generation and len(self._readers) < MAX_IDLE_READERS
+                if keep:
+                    self._readers.append(connection)
+            if not keep:
+                connection.close()
+
+    def create_tables(self):
+        """Create tables and indexes if they do not exist"""
+        try:
+            with self._lock:
+                self.connection.executescript(SCHEMA)
+                for table in ROLLUP_TABLES.values():
+                    self.connection.executescript(ROLLUP_SCHEMA.format(table=table))
+                for name, columns in RESPONSE_INDEXES.items():
+                    self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns};")
+            log_info(logger, "Tables created successfully in database")
+            return True
+        except Exception as e:
+            log_error(logger, "Error creating tables", e)
+            return False
+
+    def _rollup_from_raw(self, cursor, unit: str, replace: bool,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """Whole buckets from start's bucket to end's bucket are aggregated"""
+        table = ROLLUP_TABLES[unit]
+        bucket_format, step = ROLLUP_BUCKETS[unit]
+        query = f"""
+        INSERT INTO {table} (
+            currency_code, bucket, open_rate, high_rate, low_rate, close_rate,
+            open_time, close_time, sample_count, rate_sum, rate_sum_sq
+        )
+        SELECT
+            g.currency_code,
+            g.bucket,
+            (SELECT o.rate FROM responses o
+             WHERE o.currency_code = g.currency_code AND o.timestamp = g.open_time
+             ORDER BY o.id LIMIT 1),
+            g.high_rate,
+            g.low_rate,
+            (SELECT c.rate FROM responses c
+             WHERE c.currency_code = g.currency_code AND c.timestamp = g.close_time
+             ORDER BY c.id DESC LIMIT 1),
+            g.open_time,
+            g.close_time,
+            g.sample_count,
+            g.rate_sum,
+            g.rate_sum_sq
+        FROM (
+            SELECT
+                res.currency_code,
+                strftime('{bucket_format}', res.timestamp) AS bucket,
+                MAX(res.rate) AS high_rate,
+                MIN(res.rate) AS low_rate,
+                MIN(res.timestamp) AS open_time,
+                MAX(res.timestamp) AS close_time,
+                COUNT(*) AS sample_count,
+                SUM(res.rate) AS rate_sum,
+                SUM(res.rate * res.rate) AS rate_sum_sq
+            FROM responses res
+            JOIN requests r ON res.request_id = r.id
+            WHERE r.status = 'success'
+              AND (:start IS NULL OR res.timestamp >= :start)
+              AND (:end IS NULL OR res.timestamp < :end)
+            GROUP BY res.currency_code, strftime('{bucket_format}', res.timestamp)
+        ) g
+        WHERE true
+        {ROLLUP_REPLACE if replace else 'ON CONFLICT (currency_code, bucket) DO NOTHING'};
+        """
+        cursor.execute(query, {
+            'start': _bucket(start, unit) if start else None,
+            'end': _bucket(end, unit) + step if end else None,
+        })
+        return cursor.rowcount
+
+    def _carry_forward_rates(self, cursor, cutoff: datetime) -> int:
+        """Re-store at the retention cutoff every rate whose last row is older"""
+        cursor.execute("""
+        SELECT l.currency_code, l.rate
+        FROM latest_rates l
+        WHERE l.timestamp < :cutoff
+          AND NOT EXISTS (
+              SELECT 1 FROM responses res
+              WHERE res.currency_code = l.currency_code AND res.timestamp >= :cutoff
+          );
+        """, {'cutoff': cutoff})
+        rates = cursor.fetchall()
+        if not rates:
+            return 0
+
+        cursor.execute(
+            "INSERT INTO requests (timestamp, request_type, status, rates_changed) "
+            "VALUES (?, 'carry_forward', 'success', ?);",
+            (cutoff, len(rates))
+        )
+        request_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO responses (request_id, currency_code, rate, timestamp) VALUES (?, ?, ?, ?);",
+            [(request_id, row['currency_code'], row['rate'], cutoff) for row in rates]
+        )
+        return len(rates)
+
+    def maintain_storage(self) -> bool:
+        """Downsample and delete raw ticks older than the retention period"""
+        retention_months = STORAGE_CONFIG['retention_months']
+        if retention_months <= 0:
+            return True
+
+        try:
+            cutoff = datetime.combine(retention_cutoff(), datetime.min.time())
+            with self._transaction() as cursor:
+                rolled_up = self._rollup_from_raw(cursor, 'day', False, end=cutoff - timedelta(days=1))
+                carried = self._carry_forward_rates(cursor, cutoff)
+                cursor.execute("DELETE FROM requests WHERE timestamp < ?;", (cutoff,))
+                removed = cursor.rowcount
+                cursor.execute(f"DELETE FROM {ROLLUP_TABLES['hour']} WHERE bucket < ?;", (cutoff,))
+            if removed:
+                log_info(logger, "Removed %d expired requests after rolling up %d daily rows", removed, rolled_up)
+            if carried:
+                log_info(logger, "Carried %d unchanged rates forward to %s", carried, cutoff.date())
+            return True
+        except Exception as e:
+            log_error(logger, "Error maintaining storage", e)
+            return False
+
+    @timed_query('insert_request')
+    def insert_request(self, request_type: str, status: str, error_message: Optional[str] = None) -> Optional[int]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO requests (timestamp, request_type, status, error_message) VALUES (?, ?, ?, ?);",
+                    (datetime.now(), request_type, status, error_message)
+                )
+                return cursor.lastrowid
+        except Exception as e:
+            log_error(logger, "Error inserting request", e)
+            return None
+
+    def _write_rates(self, cursor, request_id: int, rates: Dict[str, float], recorded_at: datetime):
+        rows = [(request_id, currency, float(rate), recorded_at) for currency, rate in rates.items()]
+        count_rows_written(len(rows))
+        cursor.executemany(
+            "INSERT INTO responses (request_id, currency_code, rate, timestamp) VALUES (?, ?, ?, ?);",
+            rows
+        )
+
+    def _upsert_latest_rates(self, cursor, rows: List[Tuple[str, float, datetime, int]], newer_only: bool = False):
+        """Upsert (currency, rate, timestamp, request_id) rows; newer_only leaves equal timestamps alone"""
+        cursor.executemany(
+            f"""
+            INSERT INTO latest_rates (currency_code, rate, timestamp, request_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (currency_code) DO UPDATE SET
+                previous_rate = rate,
+                previous_timestamp = timestamp,
+                rate = excluded.rate,
+                timestamp = excluded.timestamp,
+                request_id = excluded.request_id
+            WHERE excluded.timestamp {'>' if newer_only else '>='} timestamp;
+            """,
+            rows
+        )
+
+    def _update_rollups(self, cursor, rates: Dict[str, float], recorded_at: datetime):
+        """Merge rates recorded at recorded_at into its hourly and daily buckets"""
+        for unit, table in ROLLUP_TABLES.items():
+            bucket = _bucket(recorded_at, unit)
+            cursor.executemany(
+                f"""
+                INSERT INTO {table} (
+                    currency_code, bucket, open_rate, high_rate, low_rate, close_rate,
+                    open_time, close_time, sample_count, rate_sum, rate_sum_sq
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+                {ROLLUP_MERGE};
+                """,
+                [
+                    (currency, bucket, rate, rate, rate, rate, recorded_at, recorded_at, rate, rate * rate)
+                    for currency, rate in ((currency, float(rate)) for currency, rate in rates.items())
+                ]
+            )
+
+    def _load_last_stored(self, cursor) -> Dict[str, float]:
+        cursor.execute("SELECT currency_code, rate FROM latest_rates;")
+        return {row['currency_code']: float(row['rate']) for row in cursor.fetchall()}
+
+    def _write_outcome(self, cursor, request_id: int, status: str, error_message: Optional[str],
+                       rates_changed: Optional[int], stored_rates: Optional[Dict[str, float]],
+                       rates: Optional[Dict[str, float]]) -> datetime:
+        recorded_at = datetime.now()
+        cursor.execute(
+            "UPDATE requests SET status = ?, error_message = ?, rates_changed = ? WHERE id = ?;",
+            (status, error_message, rates_changed, request_id)
+        )
+        if stored_rates:
+            self._write_rates(cursor, request_id, stored_rates, recorded_at)
+            if status == 'success':
+                self._upsert_latest_rates(cursor, [
+                    (currency, float(rate), recorded_at, request_id)
+                    for currency, rate in stored_rates.items()
+                ])
+        if rates and status == 'success':
+            self._update_rollups(cursor, rates, recorded_at)
+        return recorded_at
+
+    def _drop_response_indexes(self, cursor) -> int:
+        for name in RESPONSE_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name};")
+        return len(RESPONSE_INDEXES)
+
+    def _create_response_indexes(self, cursor):
+        for name, columns in RESPONSE_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns};")
+        cursor.execute("ANALYZE responses;")
+
+    def _bulk_load_rates(self, ticks: List[Tuple[datetime, Dict[str, float]]], request_type: str) -> int:
+        newest: Dict[str, Tuple[str, float, datetime, int]] = {}
+        rows = 0
+        with self._transaction() as cursor:
+            for timestamp, rates in ticks:
+                cursor.execute(
+                    "INSERT INTO requests (timestamp, request_type, status, rates_changed) VALUES (?, ?, 'success', ?);",
+                    (timestamp, request_type, len(rates))
+                )
+                request_id = cursor.lastrowid
+                self._write_rates(cursor, request_id, rates, timestamp)
+                for currency, rate in rates.items():
+                    if currency not in newest or newest[currency][2] < timestamp:
+                        newest[currency] = (currency, float(rate), timestamp, request_id)
+                rows += len(rates)
+            self._upsert_latest_rates(cursor, list(newest.values()), newer_only=True)
+        return rows
+
+    def _fetch(self, query: str, params=(), error_message: str = "Database query failed") -> List[Dict]:
+        try:
+            with self._read_transaction() as cursor:
+                cursor.execute(query, params)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            log_error(logger, error_message, e)
+            return []
+
+    @timed_query('get_request_history')
+    def get_request_history(self) -> List[Dict]:
+        query = """
+        WITH recent AS (
+            SELECT id, timestamp, request_type, status, error_message, rates_changed
+            FROM requests
+            ORDER BY timestamp DESC
+            LIMIT 100
+        )
+        SELECT
+            r.id AS request_id,
+            r.timestamp AS "request_time [TIMESTAMP]",
+            r.request_type,
+            r.status,
+            r.error_message,
+            r.rates_changed,
+            COUNT(res.id) AS currency_count,
+            GROUP_CONCAT(res.currency_code || ': ' || res.rate, ', ') AS currency_rates
+        FROM recent r
+        LEFT JOIN responses res ON r.id = res.request_id
+        GROUP BY r.id
+        ORDER BY r.timestamp DESC;
+        """
+        return self._fetch(query, error_message="Error getting request history")
+
+    def _query_latest_rates(self) -> List[Dict]:
+        with self._read_transaction() as cursor:
+            cursor.execute("""
+            SELECT currency_code, rate, timestamp, 'success' AS status
+            FROM latest_rates
+            ORDER BY currency_code;
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query('get_rate_history')
+    def get_rate_history(self, currency_code: str, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, limit: int = 1000) -> List[Dict]:
+        query = """
+        SELECT res.rate, res.timestamp
+        FROM responses res
+        JOIN requests r ON res.request_id = r.id
+        WHERE r.status = 'success'
+          AND res.currency_code = :currency
+          AND (:start IS NULL OR res.timestamp >= :start)
+          AND (:end IS NULL OR res.timestamp < :end)
+        ORDER BY res.timestamp DESC
+        LIMIT :limit;
+        """
+        params = {'currency': currency_code, 'start': start, 'end': end, 'limit': limit}
+        return self._fetch(query, params, "Error getting rate history")
+
+    def iter_rate_history(self, currency_codes: Optional[Sequence[str]] = None,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          after: Optional[Tuple[datetime, int]] = None, descending: bool = False,
+                          page_size: int = 5000) -> Iterator[Dict]:
+        order, direction = ('DESC', '<') if descending else ('ASC', '>')
+        conditions = ["r.status = 'success'"]
+        params: List = []
+        if currency_codes:
+            conditions.append(f"res.currency_code IN ({', '.join('?' for _ in currency_codes)})")
+            params.extend(currency_codes)
+        if start is not None:
+            conditions.append("res.timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("res.timestamp < ?")
+            params.append(end)
+
+        base_query = f"""
+        SELECT res.id, res.request_id, res.currency_code, res.rate, res.timestamp
+        FROM responses res
+        JOIN requests r ON res.request_id = r.id
+        WHERE {' AND '.join(conditions)}
+        """
+        while True:
+            query = base_query
+            page_params = list(params)
+            if after is not None:
+                query += f" AND (res.timestamp, res.id) {direction} (?, ?)"
+                page_params.extend(after)
+            query += f" ORDER BY res.timestamp {order}, res.id {order} LIMIT ?;"
+            page_params.append(page_size)
+
+            with query_timer('iter_rate_history'), self._read_transaction() as cursor:
+                cursor.execute(query, page_params)
+                page = [dict(row) for row in cursor.fetchall()]
+
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1]['timestamp'], page[-1]['id'])
+
+    @timed_query('get_recent_rates')
+    def get_recent_rates(self, points: int) -> List[Dict]:
+        try:
+            results = []
+            with self._read_transaction() as cursor:
+                cursor.execute("SELECT currency_code FROM latest_rates;")
+                for (currency_code,) in cursor.fetchall():
+                    cursor.execute("""
+                    SELECT currency_code, rate, timestamp
+                    FROM responses
+                    WHERE currency_code = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?;
+                    """, (currency_code, points))
+                    results.extend(dict(row) for row in cursor.fetchall())
+            results.sort(key=lambda row: (row['timestamp'], row['currency_code']))
+            return results
+        except Exception as e:
+            log_error(logger, "Error getting recent rates", e)
+            return []
+
+    @timed_query('get_rates_as_of')
+    def get_rates_as_of(self, moment: datetime) -> List[Dict]:
+        # SQLite takes bare columns from the row that holds the MAX()
+        query = """
+        SELECT res.currency_code, res.rate, MAX(res.timestamp) AS "timestamp [TIMESTAMP]"
+        FROM responses res
+        JOIN requests r ON res.request_id = r.id
+        WHERE r.status = 'success' AND res.timestamp <= ?
+        GROUP BY res.currency_code
+        ORDER BY res.currency_code;
+        """
+        return self._fetch(query, (moment,), "Error getting rates as of date")
+
+    @timed_query('get_rate_changes')
+    def get_rate_changes(self) -> List[Dict]:
+        query = """
+        SELECT
+            currency_code,
+            rate AS current_rate,
+            timestamp AS "current_time [TIMESTAMP]",
+            previous_rate,
+            previous_timestamp AS "previous_time [TIMESTAMP]",
+            ROUND((rate - previous_rate) / previous_rate * 100, 4) AS percentage_change
+        FROM latest_rates
+        WHERE previous_rate IS NOT NULL AND previous_rate <> 0
+        ORDER BY ABS((rate - previous_rate) / previous_rate) DESC;
+        """
+        return self._fetch(query, error_message="Error getting rate changes")
+
+    @timed_query('rollup')
+    def get_daily_trends(self, currency_code: Optional[str] = None, days: int = 30) -> List[Dict]:
+        query = f"""
+        SELECT
+            currency_code,
+            bucket AS "date [DATE]",
+            open_rate,
+            high_rate AS max_rate,
+            low_rate AS min_rate,
+            close_rate,
+            rate_sum / sample_count AS avg_rate,
+            {ROLLUP_STDDEV} AS rate_stddev,
+            sample_count
+        FROM {ROLLUP_TABLES['day']}
+        WHERE bucket >= :since
+          AND (:currency IS NULL OR currency_code = :currency)
+        ORDER BY currency_code, bucket DESC;
+        """
+        since = _bucket(datetime.now(), 'day') - timedelta(days=days)
+        return self._fetch(query, {'since': since, 'currency': currency_code}, "Error getting daily trends")
+
+    @timed_query('rollup')
+    def get_hourly_stats(self, currency_code: Optional[str] = None, hours: int = 24) -> List[Dict]:
+        query = f"""
+        SELECT
+            currency_code,
+            bucket AS "hour [TIMESTAMP]",
+            open_rate,
+            high_rate,
+            low_rate,
+            close_rate,
+            rate_sum / sample_count AS avg_rate,
+            {ROLLUP_STDDEV} AS rate_stddev,
+            sample_count
+        FROM {ROLLUP_TABLES['hour']}
+        WHERE bucket >= :since
+          AND (:currency IS NULL OR currency_code = :currency)
+        ORDER BY currency_code, bucket DESC;
+        """
+        since = _bucket(datetime.now(), 'hour') - timedelta(hours=hours)
+        return self._fetch(query, {'since': since, 'currency': currency_code}, "Error getting hourly stats")
+
+    @timed_query('rollup')
+    def get_volatility_ranking(self) -> List[Dict]:
+        query = f"""
+        WITH totals AS (
+            SELECT
+                currency_code,
+                SUM(sample_count) AS sample_count,
+                SUM(rate_sum) AS rate_sum,
+                SUM(rate_sum_sq) AS rate_sum_sq,
+                MIN(low_rate) AS min_rate,
+                MAX(high_rate) AS max_rate
+            FROM {ROLLUP_TABLES['day']}
+            GROUP BY currency_code
+        )
+        SELECT
+            currency_code,
+            sample_count AS data_points,
+            ROUND(rate_sum / sample_count, 6) AS average_rate,
+            ROUND({ROLLUP_STDDEV}, 6) AS rate_volatility,
+            ROUND(min_rate, 6) AS min_rate,
+            ROUND(max_rate, 6) AS max_rate
+        FROM totals
+        ORDER BY rate_volatility ASC NULLS LAST;
+        """
+        return self._fetch(query, error_message="Error getting volatility ranking")
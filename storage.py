@@ -0,0 +1,398 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import metrics
+from logger import logger, log_error, log_info, log_warning
+from config import INGEST_CONFIG, STORAGE_CONFIG
+
+# Rollup tables keyed by the unit of their buckets
+ROLLUP_TABLES = {'hour': 'rates_hourly', 'day': 'rates_daily'}
+
+# Secondary indexes of responses on every backend; bulk loads drop and rebuild them
+RESPONSE_INDEXES = {
+    'idx_responses_request_id': 'responses(request_id)',
+    'idx_responses_currency_timestamp': 'responses(currency_code, timestamp DESC)',
+    'idx_responses_timestamp_id': 'responses(timestamp, id)',
+}
+
+def add_months(month_start: date, months: int) -> date:
+    """First day of the month that is `months` away from month_start"""
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def retention_cutoff() -> date:
+    """First day of the oldest month kept by the retention policy"""
+    return add_months(date.today().replace(day=1), -STORAGE_CONFIG['retention_months'])
+
+def rollup_stddev(greatest: str) -> str:
+    """Sample standard deviation from a rollup's count, sum and sum of squares.
+
+    greatest is the backend's two-argument maximum (GREATEST or MAX), which
+    clamps the variance at 0 against rounding errors.
+    """
+    return f"""
+CASE WHEN sample_count > 1
+     THEN SQRT({greatest}((rate_sum_sq - rate_sum * rate_sum / sample_count) / (sample_count - 1), 0))
+END
+""".strip()
+
+QUERY_SECONDS = ('currency_db_query_seconds', 'Latency of database operations')
+
+def timed_query(operation: str):
+    """Decorator recording the latency of one storage operation"""
+    return metrics.timed(*QUERY_SECONDS, operation=operation)
+
+def query_timer(operation: str):
+    """Context manager recording the latency of one query, e.g. one page of a generator"""
+    return metrics.timer(*QUERY_SECONDS, operation=operation)
+
+def count_rows_written(rows: int):
+    metrics.inc('currency_rows_written_total', rows, 'Rate rows written to the responses table')
+
+def count_db_error(error: Exception):
+    metrics.inc('currency_db_errors_total', help_text='Failed database transactions by error type',
+                error=type(error).__name__)
+
+class RatesSnapshot:
+    """In-memory latest rate per currency that expires after a TTL"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._rates: Dict[str, Dict] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def load(self, rows: List[Dict]):
+        """Replace the snapshot with rows read from the database"""
+        rates = {
+            row['currency_code']: {**row, 'rate': float(row['rate'])}
+            for row in rows
+        }
+        with self._lock:
+            self._rates = rates
+            self._loaded_at = time.monotonic()
+
+    def update(self, rates: Dict[str, float], timestamp):
+        """Merge freshly stored rates; a cold snapshot is left for the next load"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            merged = dict(self._rates)
+            for currency, rate in rates.items():
+                merged[currency] = {
+                    'currency_code': currency,
+                    'rate': float(rate),
+                    'timestamp': timestamp,
+                    'status': 'success',
+                }
+            self._rates = merged
+
+    def invalidate(self):
+        with self._lock:
+            self._rates = {}
+            self._loaded_at = None
+
+    def get(self, currency_code: str) -> Optional[Dict]:
+        rate = self._rates.get(currency_code)
+        return dict(rate) if rate else None
+
+    def rows(self) -> List[Dict]:
+        rates = self._rates
+        return [dict(rates[code]) for code in sorted(rates)]
+
+class StorageBackend(ABC):
+    """Persistence used by the service, HTTP API and maintenance tools.
+
+    Public methods follow the service's error convention: failures are logged
+    and reported as False, None or an empty list rather than raised. Every
+    abstract method must be implemented before a backend can be created;
+    behaviour shared by the backends lives here and leaves the SQL to hooks.
+    """
+
+    def __init__(self, snapshot_ttl_seconds: int):
+        self.snapshot = RatesSnapshot(snapshot_ttl_seconds)
+        self.partitioned = False
+        self.is_leader = False
+        # Last stored rate per currency for delta storage, loaded lazily from latest_rates
+        self._last_stored: Optional[Dict[str, float]] = None
+
+    # Connection and schema
+
+    @abstractmethod
+    def _transaction(self):
+        """Context manager yielding a cursor whose rows support row['column'], committing on success"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def connect(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def disconnect(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def check_health(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_tables(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def try_acquire_leadership(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_leadership(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def maintain_storage(self) -> bool:
+        raise NotImplementedError
+
+    def rebuild_rollups(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> bool:
+        """Recompute hourly and daily rollups from raw responses in [start, end].
+
+        Under delta storage responses lack the unchanged rates that live
+        rollups counted, so only buckets without a rollup row are filled in.
+        """
+        replace = not INGEST_CONFIG['delta_storage']
+        if not replace:
+            log_warning(logger, "Delta storage: keeping existing rollup rows, only filling missing buckets")
+        try:
+            with self._transaction() as cursor:
+                for unit, table in ROLLUP_TABLES.items():
+                    rows = self._rollup_from_raw(cursor, unit, replace, start, end)
+                    log_info(logger, "Rebuilt %d rows of %s", rows, table)
+            return True
+        except Exception as e:
+            log_error(logger, "Error rebuilding rollups", e)
+            return False
+
+    @abstractmethod
+    def _rollup_from_raw(self, cursor, unit: str, replace: bool,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """Aggregate raw ticks between start and end into the rollup table for `unit`.
+
+        Existing buckets are overwritten when replace is set and kept otherwise.
+        Returns the number of rollup rows written.
+        """
+        raise NotImplementedError
+
+    # Writes
+
+    @abstractmethod
+    def insert_request(self, request_type: str, status: str, error_message: Optional[str] = None) -> Optional[int]:
+        """Insert a request record and return its id"""
+        raise NotImplementedError
+
+    @timed_query('complete_request')
+    def complete_request(self, request_id: int, status: str,
+                         rates: Optional[Dict[str, float]] = None,
+                         error_message: Optional[str] = None) -> bool:
+        """Record the request outcome and its rates in one transaction.
+
+        In delta storage mode only rates that changed since the last stored
+        value get responses rows; unchanged ticks leave a heartbeat on the
+        requests row through rates_changed. The SQL is left to _write_outcome.
+        """
+        try:
+            delta = INGEST_CONFIG['delta_storage'] and status == 'success' and bool(rates)
+            with self._transaction() as cursor:
+                if delta and self._last_stored is None:
+                    self._last_stored = self._load_last_stored(cursor)
+                stored_rates = self._filter_changed(rates) if delta else rates
+                rates_changed = len(stored_rates) if delta else None
+                recorded_at = self._write_outcome(cursor, request_id, status, error_message,
+                                                  rates_changed, stored_rates, rates)
+
+            if stored_rates and status == 'success':
+                self.snapshot.update(stored_rates, recorded_at)
+                if self._last_stored is not None:
+                    self._last_stored.update({currency: float(rate) for currency, rate in stored_rates.items()})
+            if delta:
+                log_info(logger, "Saved %d changed of %d currency rates", len(stored_rates), len(rates))
+            elif rates:
+                log_info(logger, "Successfully saved %d currency rates", len(rates))
+            return True
+
+        except Exception as e:
+            log_error(logger, "Error completing request", e)
+            return False
+
+    @abstractmethod
+    def _load_last_stored(self, cursor) -> Dict[str, float]:
+        """Latest stored rate per currency, read from latest_rates"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _write_outcome(self, cursor, request_id: int, status: str, error_message: Optional[str],
+                       rates_changed: Optional[int], stored_rates: Optional[Dict[str, float]],
+                       rates: Optional[Dict[str, float]]) -> datetime:
+        """Update the requests row, store stored_rates and fold all fetched rates into the rollups.
+
+        Returns the time the rates were recorded at.
+        """
+        raise NotImplementedError
+
+    @timed_query('bulk_load_rates')
+    def bulk_load_rates(self, ticks: List[Tuple[datetime, Dict[str, float]]], request_type: str) -> Optional[int]:
+        """Store historical ticks with their own timestamps; returns the number of rates written or None on error.
+
+        Every tick becomes one successful request. latest_rates only moves
+        forward, so loading older dates never replaces a newer live rate.
+        Rollups are left to rebuild_rollups().
+        """
+        ticks = [(timestamp, rates) for timestamp, rates in ticks if rates]
+        if not ticks:
+            return 0
+
+        try:
+            rows = self._bulk_load_rates(ticks, request_type)
+        except Exception as e:
+            log_error(logger, "Error bulk loading rates", e)
+            return None
+        self.snapshot.invalidate()
+        return rows
+
+    @abstractmethod
+    def _bulk_load_rates(self, ticks: List[Tuple[datetime, Dict[str, float]]], request_type: str) -> int:
+        """Write non-empty ticks and advance latest_rates in one transaction; returns the rates written"""
+        raise NotImplementedError
+
+    @contextmanager
+    def deferred_response_indexes(self, enabled: bool = True):
+        """Drop the secondary indexes of responses for a bulk load and rebuild them afterwards"""
+        if not enabled:
+            yield
+            return
+
+        with self._transaction() as cursor:
+            dropped = self._drop_response_indexes(cursor)
+        log_info(logger, "Dropped %d responses indexes for bulk load", dropped)
+        try:
+            yield
+        finally:
+            with self._transaction() as cursor:
+                self._create_response_indexes(cursor)
+            log_info(logger, "Rebuilt responses indexes")
+
+    @abstractmethod
+    def _drop_response_indexes(self, cursor) -> int:
+        """Drop the secondary indexes of responses; returns how many were dropped"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _create_response_indexes(self, cursor):
+        """Create the secondary indexes of responses and refresh its statistics"""
+        raise NotImplementedError
+
+    def reset_delta_state(self):
+        """Forget the in-memory last stored rates, e.g. after another writer took over"""
+        self._last_stored = None
+
+    def _filter_changed(self, rates: Dict[str, float]) -> Dict[str, float]:
+        """Rates that differ from the last stored value at 8 decimal places"""
+        return {
+            currency: rate
+            for currency, rate in rates.items()
+            if currency not in self._last_stored
+            or round(float(rate), 8) != round(self._last_stored[currency], 8)
+        }
+
+    # Reads
+
+    @abstractmethod
+    def get_request_history(self) -> List[Dict]:
+        """Latest 100 requests with their stored rates"""
+        raise NotImplementedError
+
+    @timed_query('get_latest_rates')
+    def get_latest_rates(self) -> List[Dict]:
+        """Get latest currency rates, from the in-memory snapshot while it is fresh"""
+        if self.snapshot.is_fresh():
+            return self.snapshot.rows()
+
+        try:
+            self.snapshot.load(self._query_latest_rates())
+            return self.snapshot.rows()
+        except Exception as e:
+            log_error(logger, "Error getting latest rates", e)
+            return []
+
+    @abstractmethod
+    def _query_latest_rates(self) -> List[Dict]:
+        """Every row of latest_rates as currency_code, rate, timestamp and status, by currency"""
+        raise NotImplementedError
+
+    def get_latest_rate(self, currency_code: str) -> Optional[Dict]:
+        """Get the latest rate of one currency"""
+        if not self.snapshot.is_fresh():
+            self.get_latest_rates()
+        return self.snapshot.get(currency_code)
+
+    @abstractmethod
+    def get_rate_history(self, currency_code: str, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, limit: int = 1000) -> List[Dict]:
+        """Stored rates of one currency within a time range, newest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_rate_history(self, currency_codes: Optional[Sequence[str]] = None,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          after: Optional[Tuple[datetime, int]] = None, descending: bool = False,
+                          page_size: int = 5000) -> Iterator[Dict]:
+        """Stream stored rates in (timestamp, id) order, one keyset page at a time.
+
+        Memory stays bounded and nothing is held open while the caller
+        consumes rows. Resume an interrupted walk by passing the (timestamp, id)
+        of the last row received as after. Errors propagate to the caller
+        instead of ending the stream early.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recent_rates(self, points: int) -> List[Dict]:
+        """Newest stored points of every tracked currency, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_rates_as_of(self, moment: datetime) -> List[Dict]:
+        """Rate of every currency in effect at a point in time.
+
+        Correct under delta storage as well, since an unchanged rate stays in
+        effect until its next stored row.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_rate_changes(self) -> List[Dict]:
+        """Compare the current and previous rate of every currency"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_daily_trends(self, currency_code: Optional[str] = None, days: int = 30) -> List[Dict]:
+        """Daily OHLC, mean and stddev per currency from the daily rollup"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_hourly_stats(self, currency_code: Optional[str] = None, hours: int = 24) -> List[Dict]:
+        """Hourly OHLC, mean and stddev per currency from the hourly rollup"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_volatility_ranking(self) -> List[Dict]:
+        """Currencies ordered from most to least stable over the whole daily rollup"""
+        raise NotImplementedError
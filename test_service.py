@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 import sys
 import os
-from datetime import datetime
+import tempfile
+from unittest import mock
+from datetime import datetime, timedelta
 from logger import logger, log_info, log_error
 from database import db_manager
 from api_client import api_client
+import export
+from cross_rates import CrossRateMatrix
+from metrics import MetricsRegistry
+from sqlite_storage import SQLiteStorage
+from timeseries import RateSeries
 
 def test_database_connection():
     log_info(logger, "=== TESTING DATABASE CONNECTION ===")
@@ -51,6 +58,147 @@ def test_data_retrieval():
         log_error(logger, f"✗ Error retrieving data: {error_msg}")
         return False
 
+def test_cross_rates():
+    log_info(logger, "=== TESTING CROSS-RATE MATRIX ===")
+    
+    matrix = CrossRateMatrix('USD', {'USD': 1.0, 'EUR': 0.5, 'JPY': 150.0})
+    
+    if abs(matrix.convert('EUR', 'JPY', 2.0) - 600.0) > 1e-9:
+        log_error(logger, "✗ Wrong EUR->JPY conversion")
+        return False
+    if list(matrix.convert_many('JPY', 'USD', [150.0, 300.0])) != [1.0, 2.0]:
+        log_error(logger, "✗ Wrong batch conversion")
+        return False
+    
+    log_info(logger, "✓ Cross rates computed correctly")
+    return True
+
+def test_rate_series():
+    log_info(logger, "=== TESTING RATE RING BUFFER ===")
+    
+    series = RateSeries(3)
+    for second in range(1, 6):
+        series.append(float(second * 60), float(second))
+    
+    if series.append(120.0, 99.0) or len(series) != 3:
+        log_error(logger, "✗ Out-of-order point was stored")
+        return False
+    timestamps, rates = series.window()
+    if list(rates) != [3.0, 4.0, 5.0] or list(timestamps) != [180.0, 240.0, 300.0]:
+        log_error(logger, "✗ Wrong window after wraparound")
+        return False
+    if list(series.window(points=2)[1]) != [4.0, 5.0] or list(series.window(seconds=60)[1]) != [4.0, 5.0]:
+        log_error(logger, "✗ Wrong window by points or seconds")
+        return False
+    if series.stats()['change_pct'] != (5.0 - 3.0) / 3.0 * 100:
+        log_error(logger, "✗ Wrong window statistics")
+        return False
+    
+    log_info(logger, "✓ Ring buffer wraps and windows correctly")
+    return True
+
+def test_metrics_rendering():
+    log_info(logger, "=== TESTING METRICS RENDERING ===")
+    
+    registry = MetricsRegistry()
+    registry.counter('test_errors_total', 'Errors').inc(2, type='a"b')
+    histogram = registry.histogram('test_seconds', 'Latency')
+    histogram.observe(0.003)
+    histogram.observe(7.0)
+    lines = registry.render().splitlines()
+    
+    expected = [
+        'test_errors_total{type="a\\"b"} 2',
+        'test_seconds_bucket{le="0.005"} 1',
+        'test_seconds_bucket{le="5.0"} 1',
+        'test_seconds_bucket{le="+Inf"} 2',
+        'test_seconds_count 2',
+        '# TYPE test_seconds histogram',
+    ]
+    missing = [line for line in expected if line not in lines]
+    if missing:
+        log_error(logger, f"✗ Missing metric lines: {missing}")
+        return False
+    
+    log_info(logger, "✓ Metrics rendered in the Prometheus text format")
+    return True
+
+def test_incremental_export():
+    log_info(logger, "=== TESTING INCREMENTAL COLUMNAR EXPORT ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, 'currency.db'))
+        if not storage.connect() or not storage.create_tables():
+            log_error(logger, "✗ Failed to open SQLite database")
+            return False
+        output = os.path.join(directory, 'export')
+        try:
+            day = datetime(2024, 1, 1)
+            storage.bulk_load_rates([(day, {'EUR': 0.9, 'GBP': 0.8})], 'import')
+            with mock.patch.object(export, 'db_manager', storage):
+                first = export.export_rates(output, page_size=1)
+                exported = {column: values.copy() for column, values in export.load_export(output).items()}
+                storage.bulk_load_rates([(day + timedelta(hours=1), {'EUR': 0.91})], 'import')
+                second = export.export_rates(output, page_size=1)
+            columns = export.load_export(output)
+        finally:
+            storage.disconnect()
+        
+        if (first, second) != (2, 1) or export.read_manifest(output)['rows'] != 3:
+            log_error(logger, f"✗ Export added {first} then {second} rows, expected 2 then 1")
+            return False
+        if any(list(columns[column][:2]) != list(values) for column, values in exported.items()):
+            log_error(logger, "✗ Second export rewrote previously exported rows")
+            return False
+        if list(columns['rate'][2:]) != [0.91] or columns['timestamp'][2].item() != day + timedelta(hours=1):
+            log_error(logger, "✗ Second export appended the wrong rows")
+            return False
+    
+    log_info(logger, "✓ Export appends only rows stored since the last run")
+    return True
+
+def test_sqlite_storage():
+    log_info(logger, "=== TESTING SQLITE STORAGE BACKEND ===")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, 'currency.db'))
+        if not storage.connect() or not storage.create_tables():
+            log_error(logger, "✗ Failed to open SQLite database")
+            return False
+        try:
+            request_id = storage.insert_request('currency_rates', 'pending')
+            if not request_id or not storage.complete_request(request_id, 'success', rates={'EUR': 0.9, 'GBP': 0.8}):
+                log_error(logger, "✗ Failed to store a request")
+                return False
+            storage.snapshot.invalidate()
+            latest = {row['currency_code']: row['rate'] for row in storage.get_latest_rates()}
+            if latest != {'EUR': 0.9, 'GBP': 0.8}:
+                log_error(logger, f"✗ Wrong latest rates: {latest}")
+                return False
+            
+            day = datetime(2024, 1, 1)
+            ticks = [(day + timedelta(hours=hour), {'EUR': 1.0 + hour, 'GBP': 2.0}) for hour in range(3)]
+            if storage.bulk_load_rates(ticks, 'import') != 6:
+                log_error(logger, "✗ Bulk load stored the wrong number of rates")
+                return False
+            if storage.get_latest_rate('EUR')['rate'] != 0.9:
+                log_error(logger, "✗ Older bulk-loaded rates replaced the latest rate")
+                return False
+            
+            rows = list(storage.iter_rate_history(['EUR'], page_size=2))
+            if [row['rate'] for row in rows] != [1.0, 2.0, 3.0, 0.9]:
+                log_error(logger, "✗ Wrong rate history pages")
+                return False
+            resumed = list(storage.iter_rate_history(['EUR'], after=(rows[1]['timestamp'], rows[1]['id']), page_size=2))
+            if [row['id'] for row in resumed] != [row['id'] for row in rows[2:]]:
+                log_error(logger, "✗ Wrong rate history after a keyset")
+                return False
+        finally:
+            storage.disconnect()
+    
+    log_info(logger, "✓ SQLite backend stores and pages rates correctly")
+    return True
+
 def main():
     print("=" * 60)
     print("CURRENCY SERVICE TESTING")
@@ -61,6 +209,11 @@ def main():
         ("Database connection", test_database_connection),
         ("API connection", test_api_connection),
         ("Data retrieval", test_data_retrieval),
+        ("Cross-rate matrix", test_cross_rates),
+        ("Rate ring buffer", test_rate_series),
+        ("Metrics rendering", test_metrics_rendering),
+        ("Incremental export", test_incremental_export),
+        ("SQLite storage backend", test_sqlite_storage),
     ]
     
     passed_tests = 0
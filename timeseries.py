@@ -0,0 +1,122 @@
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import TIMESERIES_CONFIG
+
+
+class RateSeries:
+    """Fixed-capacity ring buffer of (timestamp, rate) points for one currency.
+
+    Every point is written twice, at i and i + capacity, so the newest n points
+    are always one contiguous slice and windows are views rather than copies.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self.rates = np.zeros(2 * capacity, dtype=np.float64)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        if not self.size:
+            return None
+        return float(self.timestamps[self.head - 1 + self.capacity])
+
+    def append(self, timestamp: float, rate: float) -> bool:
+        """Add a point newer than the last one; older or repeated points are ignored"""
+        last = self.last_timestamp
+        if last is not None and timestamp <= last:
+            return False
+
+        self.timestamps[self.head] = self.timestamps[self.head + self.capacity] = timestamp
+        self.rates[self.head] = self.rates[self.head + self.capacity] = rate
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def window(self, points: Optional[int] = None, seconds: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Views of the newest points, limited by count and/or age relative to the newest point"""
+        count = self.size if points is None else max(0, min(points, self.size))
+        end = self.head + self.capacity
+        timestamps = self.timestamps[end - count:end]
+        rates = self.rates[end - count:end]
+        if seconds is not None and count:
+            first = int(np.searchsorted(timestamps, timestamps[-1] - seconds, side='left'))
+            timestamps, rates = timestamps[first:], rates[first:]
+        return timestamps, rates
+
+    def stats(self, points: Optional[int] = None, seconds: Optional[float] = None) -> Optional[Dict]:
+        """Mean, sample stddev, min/max and percent change over a window"""
+        timestamps, rates = self.window(points, seconds)
+        if not len(rates):
+            return None
+
+        first, last = float(rates[0]), float(rates[-1])
+        return {
+            'count': len(rates),
+            'start': datetime.fromtimestamp(timestamps[0]),
+            'end': datetime.fromtimestamp(timestamps[-1]),
+            'mean': float(rates.mean()),
+            'stddev': float(rates.std(ddof=1)) if len(rates) > 1 else None,
+            'min': float(rates.min()),
+            'max': float(rates.max()),
+            'first': first,
+            'last': last,
+            'change_pct': (last - first) / first * 100 if first else None,
+        }
+
+
+class TimeSeriesStore:
+    """Per-currency rate series shared by the ingestion path and readers"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.series: Dict[str, RateSeries] = {}
+        self.warmed = False
+        self._lock = threading.Lock()
+
+    def _series_for(self, currency_code: str) -> RateSeries:
+        series = self.series.get(currency_code)
+        if series is None:
+            series = self.series[currency_code] = RateSeries(self.capacity)
+        return series
+
+    def extend(self, rows: List[Dict]) -> int:
+        """Append rows with currency_code, rate and timestamp; returns how many were new"""
+        added = 0
+        with self._lock:
+            for row in rows:
+                timestamp = row['timestamp']
+                if isinstance(timestamp, datetime):
+                    timestamp = timestamp.timestamp()
+                added += self._series_for(row['currency_code']).append(timestamp, float(row['rate']))
+        return added
+
+    def warm(self, rows: List[Dict]) -> int:
+        """Load history in ascending time order, once per process"""
+        added = self.extend(rows)
+        self.warmed = True
+        return added
+
+    def currencies(self) -> List[str]:
+        with self._lock:
+            return sorted(self.series)
+
+    def stats(self, currency_code: str, points: Optional[int] = None,
+              seconds: Optional[float] = None) -> Optional[Dict]:
+        with self._lock:
+            series = self.series.get(currency_code)
+            return series.stats(points, seconds) if series is not None else None
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(series.timestamps.nbytes + series.rates.nbytes for series in self.series.values())
+
+
+rate_series = TimeSeriesStore(TIMESERIES_CONFIG['capacity'])